@@ -247,6 +247,15 @@ class OSCMessage(object):
 		"""
 		self.clear(address)
 
+	def _getAddress(self):
+		return self._address
+
+	def _setAddress(self, address):
+		self._address = address
+		self._binary = None
+
+	address = property(_getAddress, _setAddress, doc="The OSC-address of the message")
+
 	def setAddress(self, address):
 		"""Set or change the OSC-address
 		"""
@@ -261,8 +270,55 @@ class OSCMessage(object):
 	def clearData(self):
 		"""Clear any arguments appended so far
 		"""
-		self.typetags = ","
-		self.message  = b""
+		# the typetag and the binary of every argument; each argument is
+		# encoded once, when it is appended. The encoded message and the
+		# decoded values are cached until the next change. Assigning
+		# 'typetags' or 'message' keeps both in _encoded instead, until
+		# the arguments are needed again
+		self._tags = []
+		self._binaries = []
+		self._encoded = None
+		self._message = self._binary = self._values = None
+
+	def _invalidate(self):
+		"""Drop the cached message, binary and values after a change
+		"""
+		self._message = None
+		self._binary = None
+		self._values = None
+
+	def _split(self):
+		"""Split assigned typetags and message into arguments again
+		"""
+		if self._encoded is not None:
+			self._tags, self._binaries = _splitArguments(*self._encoded)
+			self._encoded = None
+
+	def _getTypetags(self):
+		if self._encoded is not None:
+			return self._encoded[0]
+
+		return "," + "".join(self._tags)
+
+	def _setTypetags(self, typetags):
+		self._encoded = (typetags, self.message)
+		self._invalidate()
+
+	typetags = property(_getTypetags, _setTypetags, doc="The typetag-string of the arguments, including the leading ','")
+
+	def _getMessage(self):
+		if self._encoded is not None:
+			return self._encoded[1]
+		if self._message is None:
+			self._message = b"".join(self._binaries)
+
+		return self._message
+
+	def _setMessage(self, message):
+		self._encoded = (self.typetags, message)
+		self._invalidate()
+
+	message = property(_getMessage, _setMessage, doc="The binary representation of the arguments")
 
 	def append(self, argument, typehint=None):
 		"""Appends data to the message, updating the typetags based on
@@ -291,17 +347,23 @@ class OSCMessage(object):
 		else:
 			tag, binary = OSCArgument(argument, typehint)
 
-		self.typetags += tag
-		self.message += binary
+		if self._encoded is not None:
+			self._split()
+		self._tags.append(tag)
+		self._binaries.append(binary)
+		self._message = self._binary = self._values = None
 		
 	def getBinary(self):
-		"""Returns the binary representation of the message
+		"""Returns the binary representation of the message.
+		The result is cached until the message is changed
 		"""
-		binary = OSCString(self.address)
-		binary += OSCString(self.typetags)
-		binary += self.message
+		if self._binary is None:
+			if self._encoded is None:
+				self._binary = OSCString(self._address) + OSCString("," + "".join(self._tags)) + b"".join(self._binaries)
+			else:
+				self._binary = OSCString(self._address) + OSCString(self._encoded[0]) + self._encoded[1]
 		
-		return binary
+		return self._binary
 
 	def __repr__(self):
 		"""Returns a string containing the decode Message
@@ -316,7 +378,10 @@ class OSCMessage(object):
 	def __len__(self):
 		"""Returns the number of arguments appended so far
 		"""
-		return (len(self.typetags) - 1)
+		if self._encoded is not None:
+			return len(self._encoded[0]) - 1
+
+		return len(self._tags)
 	
 	def __eq__(self, other):
 		"""Return True if two OSCMessages have the same address & content
@@ -367,9 +432,14 @@ class OSCMessage(object):
 			self.append(item[1], item[0])
 		
 	def values(self):
-		"""Returns a list of the arguments appended so far
+		"""Returns a list of the arguments appended so far,
+		as a receiver would decode them
 		"""
-		return decodeOSC(self.getBinary())[2:]
+		if self._values is None:
+			self._split()
+			self._values = [_readArgument(tag, binary) for tag, binary in zip(self._tags, self._binaries)]
+
+		return list(self._values)
 	
 	def tags(self):
 		"""Returns a list of typetags of the appended arguments
@@ -380,31 +450,25 @@ class OSCMessage(object):
 		"""Returns a list of (typetag, value) tuples for 
 		the arguments appended so far
 		"""
-		out = []
-		values = list(self.values())
-		typetags = self.tags()
-		for i in range(len(values)):
-			out.append((typetags[i], values[i]))
-			
-		return out
+		return list(zip(self.tags(), self.values()))
 
 	def __contains__(self, val):
 		"""Test if the given value appears in the OSCMessage's arguments
 		"""
-		return (val in list(self.values()))
+		return (val in self.values())
 
 	def __getitem__(self, i):
 		"""Returns the indicated argument (or slice)
 		"""
-		return list(self.values())[i]
+		return self.values()[i]
 
 	def __delitem__(self, i):
 		"""Removes the indicated argument (or slice)
 		"""
-		items = list(self.items())
-		del items[i]
-			
-		self._reencode(items)
+		self._split()
+		del self._tags[i]
+		del self._binaries[i]
+		self._invalidate()
 	
 	def _buildItemList(self, values, typehint=None):
 		if isinstance(values, OSCMessage):
@@ -456,28 +520,31 @@ class OSCMessage(object):
 		"""Returns a deep copy of this OSCMessage
 		"""
 		msg = self.__class__(self.address)
-		msg.typetags = self.typetags
-		msg.message = self.message
+		# the argument tuples are immutable, so they can be shared
+		self._split()
+		msg._tags = list(self._tags)
+		msg._binaries = list(self._binaries)
+		msg._message = self._message
+		msg._values = self._values
 		return msg
 	
 	def count(self, val):
 		"""Returns the number of times the given value occurs in the OSCMessage's arguments
 		"""
-		return list(self.values()).count(val)
+		return self.values().count(val)
 	
 	def index(self, val):
 		"""Returns the index of the first occurence of the given value in the OSCMessage's arguments.
 		Raises ValueError if val isn't found
 		"""
-		return list(self.values()).index(val)
+		return self.values().index(val)
 	
 	def extend(self, values):
 		"""Append the contents of 'values' to this OSCMessage.
 		'values' can be another OSCMessage, or a list/tuple of ints/floats/strings
 		"""
-		items = list(self.items()) + self._buildItemList(values)
-		
-		self._reencode(items)
+		for item in self._buildItemList(values):
+			self.append(item[1], item[0])
 		
 	def insert(self, i, val, typehint = None):
 		"""Insert given value (with optional typehint) into the OSCMessage
@@ -494,11 +561,9 @@ class OSCMessage(object):
 		"""Delete the indicated argument from the OSCMessage, and return it
 		as a (typetag, value) tuple.
 		"""
-		items = list(self.items())
-		
-		item = items.pop(i)
+		item = self.items()[i]
 		
-		self._reencode(items)
+		del self[i]
 		
 		return item
 	
@@ -510,53 +575,42 @@ class OSCMessage(object):
 	def reverse(self):
 		"""Reverses the arguments of the OSCMessage (in place)
 		"""
-		items = list(self.items())
-		
-		items.reverse()
-		
-		self._reencode(items)
+		self._split()
+		self._tags.reverse()
+		self._binaries.reverse()
+		self._invalidate()
 		
 	def remove(self, val):
 		"""Removes the first argument with the given value from the OSCMessage.
 		Raises ValueError if val isn't found.
 		"""
-		items = list(self.items())
-		
-		# this is not very efficient...
-		i = 0
-		for (t, v) in items:
-			if (v == val):
-				break
-			i += 1
-		else:
-			raise ValueError("'%s' not in OSCMessage" % str(m))
-		# but more efficient than first calling self.values().index(val),
-		# then calling self.items(), which would in turn call self.values() again...
-		
-		del items[i]
+		try:
+			i = self.values().index(val)
+		except ValueError:
+			raise ValueError("'%s' not in OSCMessage" % str(val))
 		
-		self._reencode(items)
+		del self[i]
 		
 	def __iter__(self):
 		"""Returns an iterator of the OSCMessage's arguments
 		"""
-		return iter(list(self.values()))
+		return iter(self.values())
 
 	def __reversed__(self):
 		"""Returns a reverse iterator of the OSCMessage's arguments
 		"""
-		return reversed(list(self.values()))
+		return reversed(self.values())
 
 	def itervalues(self):
 		"""Returns an iterator of the OSCMessage's arguments
 		"""
-		return iter(list(self.values()))
+		return iter(self.values())
 
 	def iteritems(self):
 		"""Returns an iterator of the OSCMessage's arguments as
 		(typetag, value) tuples
 		"""
-		return iter(list(self.items()))
+		return iter(self.items())
 
 	def itertags(self):
 		"""Returns an iterator of the OSCMessage's arguments' typetags
@@ -587,6 +641,15 @@ class OSCBundle(OSCMessage):
 		super(OSCBundle, self).__init__(address)
 		self.timetag = time
 
+	def _getTimeTag(self):
+		return self._timetag
+
+	def _setTimeTag(self, time):
+		self._timetag = time
+		self._binary = None
+
+	timetag = property(_getTimeTag, _setTimeTag, doc="The bundle's timetag, in floating seconds since the Epoch")
+
 	def __str__(self):
 		"""Returns the Bundle's contents (and timetag, if nonzero) as a string.
 		"""
@@ -641,17 +704,20 @@ class OSCBundle(OSCMessage):
 			
 			binary = OSCBlob(msg.getBinary())
 
-		self.message += binary
-		self.typetags += 'b'
+		# the OSCMessages are rebuilt from their binary by values()
+		self._split()
+		self._tags.append('b')
+		self._binaries.append(binary)
+		self._invalidate()
 		
 	def getBinary(self):
-		"""Returns the binary representation of the message
+		"""Returns the binary representation of the bundle.
+		The result is cached until the bundle is changed
 		"""
-		binary = OSCString("#bundle")
-		binary += OSCTimeTag(self.timetag)
-		binary += self.message
+		if self._binary is None:
+			self._binary = OSCString("#bundle") + OSCTimeTag(self.timetag) + self.message
 		
-		return binary
+		return self._binary
 
 	def _reencapsulate(self, decoded):
 		if decoded[0] == "#bundle":
@@ -672,8 +738,9 @@ class OSCBundle(OSCMessage):
 		"""Returns a list of the OSCMessages appended so far
 		"""
 		out = []
-		for decoded in decodeOSC(self.getBinary())[2:]:
-			out.append(self._reencapsulate(decoded))
+		self._split()
+		for binary in self._binaries:
+			out.append(self._reencapsulate(decodeOSC(_readBlob(binary)[0])))
 			
 		return out
 		
@@ -704,8 +771,8 @@ def OSCString(next):
 	The string ends with 1 to 4 zero-bytes ('\x00') 
 	"""
 	
-	OSCstringLength = math.ceil((len(next)+1) / 4.0) * 4
-	return struct.pack(">%ds" % (OSCstringLength), str(next).encode('latin1'))
+	binary = str(next).encode('latin1')
+	return binary + b'\0' * (4 - len(binary) % 4)
 
 def OSCBlob(next):
 	"""Convert a string into an OSC Blob.
@@ -868,6 +935,45 @@ def _readDouble(data):
 
 	return (float, rest)
 
+_argumentReaders = {"s":_readString, "b":_readBlob, "t":_readTimeTag}
+_argumentStructs = {"i":struct.Struct(">i"), "f":struct.Struct(">f"), "d":struct.Struct(">d")}
+
+def _readArgument(tag, binary):
+	"""Decodes a single argument, as encoded by OSCArgument, OSCBlob or OSCTimeTag
+	"""
+	if tag in _argumentStructs:
+		return _argumentStructs[tag].unpack(binary)[0]
+	if not len(binary):
+		return None
+
+	return _argumentReaders[tag](binary)[0]
+
+def _splitArguments(typetags, message):
+	"""Splits encoded arguments into a list of typetags and a list
+	of their binaries
+	"""
+	if not typetags.startswith(","):
+		raise OSCError("OSCMessage's typetag-string lacks the magic ','")
+
+	tags = list(typetags[1:])
+	binaries = []
+	rest = message
+	for tag in tags:
+		if tag in "if":
+			size = 4
+		elif tag in "dt":
+			size = 8
+		elif tag == "s":
+			size = int(math.ceil((rest.find(b'\0') + 1) / 4.0) * 4)
+		elif tag == "b":
+			size = int(math.ceil(struct.unpack(">i", rest[0:4])[0] / 4.0) * 4) + 4
+		else:
+			raise OSCError("Unknown typetag '%s'" % tag)
+		binaries.append(rest[:size])
+		rest = rest[size:]
+
+	return (tags, binaries)
+
 def decodeOSC(data):
 	"""Converts a binary OSC message to a Python list. 
 	"""
@@ -1,56 +1,1283 @@
 #!/usr/bin/python3
 
+import bisect
+import collections
+import errno
+import heapq
+import json
+import math
+import os
+import re
+import signal
 import socket
+import struct
+import sys
+import threading
+import time
 
 import zmq
 from zocp import ZOCP
 import OSC
+from zosc_capture import CaptureWriter
+from zosc_ingress import ShardedIngress, ThreadedIngress, flatten, set_reuse_port
+
+
+# '#bundle' string and timetag that precede the elements of a bundle
+BUNDLE_HEADER_SIZE = 16
+
+# initial value for each capability type hint
+INITIAL_VALUES = {
+    'int': 0,
+    'flt': 0,
+    'string': "",
+    'vec2f': [0,0],
+    'vec3f': [0,0,0],
+    'vec4f': [0,0,0,0],
+}
+
+# format of the snapshot files written by save_snapshot
+SNAPSHOT_VERSION = 2
+
+
+def _decode_first(stuff):
+    return stuff[0]
+
+def _decode_float(stuff):
+    return float(stuff[0])
+
+def _decode_int(stuff):
+    return int(stuff[0])
+
+def _decode_vector(stuff):
+    return stuff
+
+def _decode_int_vector(stuff):
+    return [float(value) for value in stuff]
+
+def _decode_blob(stuff):
+    return stuff[0].decode('latin1')
+
+
+def parse_endpoints(endpoints):
+    # parse a list of 'host:port/prefix' urls, separated by spaces or
+    # commas, into a dict of {(host, port): prefix}
+    out = {}
+    for url in endpoints.replace(',', ' ').split():
+        (host, port), prefix = OSC.parseUrlStr(url)
+        if port is None:
+            print("Ignoring receive endpoint without port '%s'" % url)
+            continue
+        out[(host or "0.0.0.0", port)] = prefix
+
+    return out
+
+
+def compile_pattern(pattern):
+    # translate an OSC address pattern into a regular expression with a
+    # group for every wildcard, so matches can be used in a rule target
+    out = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '*':
+            out += "([^/]*)"
+        elif char == '?':
+            out += "([^/])"
+        elif char == '[':
+            end = pattern.index(']', i)
+            chars = pattern[i+1:end].replace('\\', '\\\\')
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            out += "([%s])" % chars
+            i = end
+        elif char == '{':
+            end = pattern.index('}', i)
+            out += "(%s)" % "|".join(re.escape(option) for option in pattern[i+1:end].split(','))
+            i = end
+        else:
+            out += re.escape(char)
+        i += 1
+
+    try:
+        return re.compile(out)
+    except re.error as e:
+        raise ValueError(str(e))
+
+
+class RoutingRule(object):
+    # A compiled '<pattern> <target>' rule; the target is either '-' to
+    # drop matching messages, a capability name, or 'name[index]:size' to
+    # fold the message into one element of a vector capability. '{n}' in
+    # the target is replaced by the match of the n-th wildcard
+    TARGET = re.compile(r"^([^\[]*)(?:\[([^\]]+)\](?::([234]))?)?$")
+    INDEX = re.compile(r"^(\d+)(?:([+-])(\d+))?$")
+
+    def __init__(self, order, pattern, target):
+        self.order = order
+        self.pattern = pattern
+        self.regex = compile_pattern(pattern)
+
+        match = self.TARGET.match(target)
+        if target == '-':
+            self.name = None
+            self.index = None
+            self.size = None
+        elif match and match.group(1):
+            self.name = match.group(1)
+            self.index = match.group(2)
+            self.size = int(match.group(3) or 4)
+        else:
+            raise ValueError("invalid target '%s'" % target)
+
+
+    def resolve(self, match):
+        # returns a (capability, index, size) tuple for a matched address
+        if self.name is None:
+            return (None, None, None)
+
+        groups = match.groups()
+        name = self._substitute(self.name, groups)
+        if self.index is None:
+            return (name, None, None)
+
+        index = self.INDEX.match(self._substitute(self.index, groups))
+        if not index:
+            raise ValueError("index of '%s' is not a number" % name)
+        value = int(index.group(1))
+        if index.group(2) == '+':
+            value += int(index.group(3))
+        elif index.group(2) == '-':
+            value -= int(index.group(3))
+        if not 0 <= value < self.size:
+            raise ValueError("index %d is out of range for '%s'" % (value, name))
+
+        return (name, value, self.size)
+
+
+    def _substitute(self, text, groups):
+        for i, group in enumerate(groups):
+            text = text.replace("{%d}" % (i + 1), group or "")
+        return text
+
+
+class RoutingTable(object):
+    # Maps OSC addresses to capabilities using rules in the form
+    # '<pattern> <target>', separated by newlines or ';'. Rules are indexed
+    # by their first address segment, so only rules that can match are
+    # tried, in the order they were given; the first match wins
+    def __init__(self, rules=""):
+        self.set_rules(rules)
+
+
+    def set_rules(self, rules):
+        # build the new index aside, so matching never sees a partial table
+        parsed = []
+        by_segment = {}
+        wildcards = []
+
+        for line in rules.replace(';', '\n').split('\n'):
+            parts = line.split()
+            if not parts:
+                continue
+            try:
+                if len(parts) != 2:
+                    raise ValueError("expected '<pattern> <target>'")
+                rule = RoutingRule(len(parsed), parts[0], parts[1])
+            except ValueError as e:
+                print("Ignoring routing rule '%s': %s" % (line.strip(), e))
+                continue
+
+            parsed.append(rule)
+            segment = _first_segment(rule.pattern)
+            if any(char in segment for char in "*?[]{}"):
+                wildcards.append(rule)
+            else:
+                by_segment.setdefault(segment, []).append(rule)
+
+        self.rules = parsed
+        self.by_segment = by_segment
+        self.wildcards = wildcards
+
+
+    def match(self, address):
+        # returns None if no rule matches, or a (capability, index, size)
+        # tuple; capability is None if the address should be dropped
+        candidates = heapq.merge(self.by_segment.get(_first_segment(address), []), self.wildcards,
+                key=lambda rule: rule.order)
+        for rule in candidates:
+            match = rule.regex.fullmatch(address)
+            if match:
+                return rule.resolve(match)
+
+        return None
+
+
+def _first_segment(address):
+    return address.lstrip('/').split('/', 1)[0]
+
+
+class Deadband(object):
+    # Change detection for forwarded values: numbers pass when they differ
+    # more than epsilon from the last forwarded value (a fraction of it if
+    # relative), vectors when the distance between them does or, if
+    # 'each', when any component does. Other values pass when changed
+    def __init__(self, epsilon=0, relative=False, each=False):
+        self.epsilon = epsilon
+        self.relative = relative
+        self.each = each
+
+
+    def changed(self, last, value):
+        if last is None:
+            return True
+
+        try:
+            if isinstance(value, list):
+                if len(value) != len(last):
+                    return True
+                if self.each:
+                    return any(self._differs(a, b) for a, b in zip(last, value))
+                distance = math.sqrt(sum((b - a) ** 2 for a, b in zip(last, value)))
+                if self.relative:
+                    return distance > self.epsilon * math.sqrt(sum(a ** 2 for a in last))
+                return distance > self.epsilon
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return self._differs(last, value)
+        except TypeError:
+            return True
+
+        return value != last
+
+
+    def _differs(self, last, value):
+        if self.relative:
+            return abs(value - last) > self.epsilon * abs(last)
+        return abs(value - last) > self.epsilon
+
+
+def parse_deadbands(deadbands):
+    # parse '<pattern> <epsilon>[%] [each]' rules, separated by newlines or
+    # ';', into a list of (regex, Deadband) tuples
+    out = []
+    for line in deadbands.replace(';', '\n').split('\n'):
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            if not 2 <= len(parts) <= 3 or (len(parts) == 3 and parts[2] != 'each'):
+                raise ValueError("expected '<pattern> <epsilon>[%] [each]'")
+            relative = parts[1].endswith('%')
+            epsilon = float(parts[1].rstrip('%'))
+            if relative:
+                epsilon /= 100
+            out.append((compile_pattern(parts[0]), Deadband(epsilon, relative, len(parts) == 3)))
+        except ValueError as e:
+            print("Ignoring deadband '%s': %s" % (line.strip(), e))
+
+    return out
+
+
+class Route(object):
+    # Precomputed mapping between an OSC address and a ZOCP capability,
+    # built once when the capability is registered so received and sent
+    # values only need a single dict lookup
+    __slots__ = ('address', 'capability', 'type_hint', 'tags', 'is_vector', 'decode', 'index', 'vector',
+            'deadband', 'last_value', 'namespace')
+
+    def __init__(self, address, capability, tags, index=None, vector=None, namespace=""):
+        self.address = address
+        self.capability = capability
+        self.tags = tags
+
+        # the sender namespace the address was learned in, if any
+        self.namespace = namespace
+
+        # element routes fold a single value into a shared vector
+        self.index = index
+        self.vector = vector
+
+        # optional Deadband, and the last received value it let through
+        self.deadband = None
+        self.last_value = None
+
+        numeric = len(tags) > 0 and tags.strip('ifd') == ""
+        if index is not None:
+            self.type_hint = 'vec%df' % len(vector)
+            self.decode = _decode_float
+            if not tags in ('f', 'd', 'i'):
+                self.tags = 'f'
+        elif tags in ('f', 'd'):
+            self.type_hint = 'flt'
+            self.decode = _decode_float
+        elif tags == 'i':
+            self.type_hint = 'int'
+            self.decode = _decode_int
+        elif numeric and 2 <= len(tags) <= 4:
+            self.type_hint = 'vec%df' % len(tags)
+            if 'i' in tags:
+                self.decode = _decode_int_vector
+            else:
+                self.decode = _decode_vector
+        elif tags == 'b':
+            self.type_hint = 'string'
+            self.decode = _decode_blob
+        else:
+            # anything else is shown as a string holding the first argument
+            self.type_hint = 'string'
+            self.tags = ''
+            self.decode = _decode_first
+
+        self.is_vector = self.type_hint.startswith("vec")
+
+
+    def encode(self, osc_message, value):
+        # append a ZOCP value to an OSCMessage using the original typetags
+        if self.index is not None:
+            osc_message.append(value[self.index], self.tags)
+        elif self.is_vector:
+            for tag, item in zip(self.tags, value):
+                osc_message.append(item, tag)
+        else:
+            osc_message.append(value, self.tags or None)
+
+
+class SignalCoalescer(object):
+    # Keeps only the latest value per address and releases pending values
+    # at most 'rate' times per second, either for each address separately
+    # or for all addresses at once
+    def __init__(self, rate=0, per_address=False):
+        self.rate = rate
+        self.per_address = per_address
+
+        self.pending = {}
+        self.last_flush = {}
+        self.next_flush = 0
+
+        self.suppressed = 0
+
+
+    def push(self, addr, value, now):
+        # returns True if the value should be emitted right away; 'now' is
+        # kept with pending values as the time they were received
+        if self.rate <= 0:
+            return True
+
+        if addr in self.pending:
+            # an older value is replaced before it was emitted
+            self.suppressed += 1
+        elif self.per_address and now >= self.last_flush.get(addr, 0) + 1.0 / self.rate:
+            self.last_flush[addr] = now
+            return True
+
+        self.pending[addr] = (value, now)
+        return False
+
+
+    def pop_due(self, now):
+        # returns a list of (address, value, received) tuples that are due
+        # for emitting
+        if not self.pending:
+            return []
+
+        interval = 1.0 / self.rate if self.rate > 0 else 0
+        if self.per_address:
+            due = []
+            for addr, (value, received) in list(self.pending.items()):
+                if now >= self.last_flush.get(addr, 0) + interval:
+                    self.last_flush[addr] = now
+                    del self.pending[addr]
+                    due.append((addr, value, received))
+            return due
+
+        if now < self.next_flush:
+            return []
+
+        due = [(addr, value, received) for addr, (value, received) in self.pending.items()]
+        self.pending.clear()
+        self.next_flush = now + interval
+        return due
+
+
+    def next_deadline(self):
+        # returns the time the next pending value is due, or None
+        if not self.pending:
+            return None
+
+        if self.rate <= 0:
+            return 0
+
+        if self.per_address:
+            return min(self.last_flush.get(addr, 0) for addr in self.pending) + 1.0 / self.rate
+        return self.next_flush
+
+
+
+def same_value(a, b):
+    # compare values, allowing for float32 rounding of OSC floats
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same_value(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        try:
+            return math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-9)
+        except TypeError:
+            return False
+    return a == b
+
+
+class LatencyHistogram(object):
+    # Counts latencies in fixed, exponentially growing buckets from 10us
+    # to several seconds, so recording a sample is a bisect and an add
+    BOUNDS = [0.00001 * 2 ** (i / 2.0) for i in range(40)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.total = 0
+
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.total += 1
+
+
+    def percentile(self, fraction):
+        # returns the upper bound of the bucket holding the given fraction
+        # of samples, in seconds, or 0 without samples
+        if not self.total:
+            return 0
+        needed = fraction * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= needed:
+                break
+        return self.BOUNDS[min(i, len(self.BOUNDS) - 1)]
+
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total = 0
+
+
+class StageTracer(object):
+    # Per-message timestamps (time.monotonic()) at socket receive, after
+    # decoding, after dispatch to a route and after emitting to ZOCP. The
+    # last size samples are kept in a ring buffer for dump(); every sample
+    # is also counted in a LatencyHistogram per stage
+    STAGES = ("decode", "dispatch", "emit", "total")
+
+    def __init__(self, size=4096):
+        self.samples = [None] * size
+        self.index = 0
+        self.histograms = dict((stage, LatencyHistogram()) for stage in self.STAGES)
+
+
+    def record(self, address, received, decoded, dispatched, emitted):
+        # emitted is None for values that were coalesced or not emitted yet
+        self.samples[self.index] = (address, received, decoded, dispatched, emitted)
+        self.index = (self.index + 1) % len(self.samples)
+
+        histograms = self.histograms
+        histograms["decode"].record(decoded - received)
+        histograms["dispatch"].record(dispatched - decoded)
+        if emitted is not None:
+            histograms["emit"].record(emitted - dispatched)
+            histograms["total"].record(emitted - received)
+
+
+    def summary(self):
+        # p50/p99 in ms for every stage
+        return "; ".join("%s p50 %.3f p99 %.3f" % (stage,
+                self.histograms[stage].percentile(0.5) * 1000,
+                self.histograms[stage].percentile(0.99) * 1000) for stage in self.STAGES)
+
+
+    def dump(self, path):
+        # write the samples in the ring buffer, oldest first, as tab
+        # separated address, receive time and the microseconds spent in
+        # each stage
+        samples = self.samples[self.index:] + self.samples[:self.index]
+        with open(path, 'w') as f:
+            f.write("# address\treceived\tdecode_us\tdispatch_us\temit_us\n")
+            for sample in samples:
+                if sample is None:
+                    continue
+                address, received, decoded, dispatched, emitted = sample
+                emit = "-" if emitted is None else "%.1f" % ((emitted - dispatched) * 1e6)
+                f.write("%s\t%.6f\t%.1f\t%.1f\t%s\n" % (address, received,
+                        (decoded - received) * 1e6, (dispatched - decoded) * 1e6, emit))
+
+
+
+class SamplingProfiler(object):
+    # Statistical profiler: SIGPROF interrupts the process after every
+    # interval seconds of CPU time, and the stacks of all threads are
+    # counted. Signal handlers can only be set from the main thread, so
+    # start() raises ValueError elsewhere
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.running = False
+        self._previous = None
+        self._names = {}
+        self._main = None
+
+
+    def start(self):
+        if not hasattr(signal, 'SIGPROF'):
+            raise ValueError("SIGPROF is not supported on this platform")
+        self.stacks.clear()
+        # the handler can not take the lock threading.enumerate() needs, as
+        # it may interrupt a thread holding it; threads started later are
+        # named by their ident
+        self._names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        self._main = threading.main_thread().ident
+        self._previous = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous)
+        self.running = False
+
+
+    def sample(self, signum, frame):
+        names = self._names
+        frames = sys._current_frames()
+        # the main thread is running this handler; sample what it interrupted
+        frames[self._main] = frame
+        for ident, frame in frames.items():
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+
+
+    def write(self, path):
+        # collapsed stacks, one 'frame;frame;... count' line per stack, as
+        # read by flamegraph.pl and speedscope
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write("%s %d\n" % (stack, count))
+
+
+
+class BridgeMetrics(object):
+    # Cheap counters for the bridge; rates and latency percentiles are
+    # computed over the interval since the previous report()
+    def __init__(self):
+        self.packets_in = 0
+        self.bytes_in = 0
+        self.packets_out = 0
+        self.bytes_out = 0
+        self.decode_errors = 0
+        self.dropped = 0
+        self.echoes = 0
+        self.filtered = 0
+        self.latency = LatencyHistogram()
+
+        self._last = (time.monotonic(), 0, 0, 0, 0)
+
+
+    def report(self, now):
+        # returns a dict of rates and latencies since the previous report
+        then, packets_in, bytes_in, packets_out, bytes_out = self._last
+        elapsed = max(now - then, 0.001)
+        out = {
+            'packets_in': (self.packets_in - packets_in) / elapsed,
+            'bytes_in': (self.bytes_in - bytes_in) / elapsed,
+            'packets_out': (self.packets_out - packets_out) / elapsed,
+            'bytes_out': (self.bytes_out - bytes_out) / elapsed,
+            'p50': self.latency.percentile(0.5),
+            'p99': self.latency.percentile(0.99),
+        }
+        self._last = (now, self.packets_in, self.bytes_in, self.packets_out, self.bytes_out)
+        self.latency.reset()
+        return out
+
+
+class AddressFilter(object):
+    # Include and exclude rules for OSC subtrees, in the '+<addr> -<addr>'
+    # syntax of OSC.parseFilterStr. A rule applies to its address and
+    # everything below it ('/sensors' and '/sensors/**' are the same), and
+    # the rule for the longest matching subtree wins. Without a '+/*' or
+    # '-/*' rule, addresses matching no rule are rejected if there are
+    # include rules, and accepted if there are only exclude rules
+    cache_size = 4096
+
+    def __init__(self, filters=""):
+        self.set_filters(filters)
+
+
+    def set_filters(self, filters):
+        self.subtrees = {}
+        self.default = True
+        self.cache = {}
+
+        if not filters.strip():
+            self.active = False
+            return
+
+        head, rules = OSC.parseFilterStr(filters)
+        if head:
+            # a leading address without '+' is included as well
+            rules.setdefault('/' + head.strip('/'), True)
+
+        self.default = True not in rules.values()
+        for address, include in rules.items():
+            # '/a/*' and '/a/**' are the subtree '/a', '/*' is everything
+            subtree = address.rstrip('*').rstrip('/')
+            if subtree:
+                self.subtrees[subtree] = include
+        for address, include in rules.items():
+            if not address.rstrip('*').rstrip('/'):
+                self.default = include
+        self.active = bool(self.subtrees) or not self.default
+
+
+    def accepts(self, address):
+        result = self.cache.get(address)
+        if result is None:
+            result = self.lookup(address)
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[address] = result
+        return result
+
+
+    def lookup(self, address):
+        path = address.rstrip('/')
+        while path:
+            include = self.subtrees.get(path)
+            if include is not None:
+                return include
+            path = path[:path.rfind('/')]
+        return self.default
+
+
+
+# ways of prefixing capability names with the address of their sender
+SOURCE_NAMESPACES = ("", "host", "host:port")
+
+
+class Session(object):
+    # What is known about one OSC sender: when it was seen, its packet
+    # rate over the last report interval and the addresses it sent
+    __slots__ = ('source', 'prefix', 'first_seen', 'last_seen', 'packets', 'bytes', 'rate', 'addresses', '_reported')
+
+    def __init__(self, source, prefix, now):
+        self.source = source
+        self.prefix = prefix
+        self.first_seen = now
+        self.last_seen = now
+        self.packets = 0
+        self.bytes = 0
+        self.rate = 0.0
+        self.addresses = set()
+        self._reported = (now, 0)
+
+
+    def describe(self):
+        return "%s:%s %.1f/s %d addresses" % (self.source[0], self.source[1], self.rate, len(self.addresses))
+
+
+
+class SessionTable(object):
+    # Sessions by (host, port) of the sender; sessions that were not
+    # seen for ttl seconds are evicted
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self.sessions = {}
+
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+    def get(self, source):
+        return self.sessions.get(source)
+
+
+    def touch(self, source, size, now, namespace=""):
+        session = self.sessions.get(source)
+        if session is None:
+            session = self.sessions[source] = Session(source, source_prefix(source, namespace), now)
+        session.last_seen = now
+        session.packets += 1
+        session.bytes += size
+        return session
+
+
+    def set_namespace(self, namespace):
+        for session in self.sessions.values():
+            session.prefix = source_prefix(session.source, namespace)
+
+
+    def update(self, now):
+        # compute packet rates and evict idle sessions; returns the
+        # evicted sessions
+        evicted = []
+        for source, session in list(self.sessions.items()):
+            if now - session.last_seen > self.ttl:
+                evicted.append(self.sessions.pop(source))
+                continue
+            then, packets = session._reported
+            session.rate = (session.packets - packets) / max(now - then, 0.001)
+            session._reported = (now, session.packets)
+        return evicted
+
+
+    def describe(self, limit=32):
+        # the most recently seen sessions, one per line
+        sessions = sorted(self.sessions.values(), key=lambda session: -session.last_seen)
+        return "\n".join(session.describe() for session in sessions[:limit])
+
+
+
+def source_prefix(source, namespace):
+    if namespace == "host":
+        return "/%s" % source[0]
+    if namespace == "host:port":
+        return "/%s:%s" % source
+    return ""
+
+
+class BridgeServer(OSC.OSCServer):
+    # OSCServer whose socket is read by the bridge, which decodes and
+    # dispatches the packets itself. With reuse_port, it is bound next to
+    # the shared receiver it replaces on the same address, see share(),
+    # so no packets are lost in between
+    def __init__(self, server_address, reuse_port=False):
+        self.reuse_port = reuse_port
+        super(BridgeServer, self).__init__(server_address)
+
+
+    def server_bind(self):
+        if self.reuse_port:
+            set_reuse_port(self.socket, True)
+        super(BridgeServer, self).server_bind()
+        if self.reuse_port:
+            # no other socket can bind the port until shared again
+            set_reuse_port(self.socket, False)
+
+
+    def share(self, enabled=True):
+        # let a replacement receiver bind the same address while this one
+        # is still open; returns False if that is not supported
+        return set_reuse_port(self.socket, enabled)
+
+
+
+class StreamConnection(object):
+    # An accepted OSC stream (TCP) connection. Received bytes are collected
+    # in a buffer until complete packets, each prefixed with its int32
+    # size, can be taken out
+    max_packet_size = 1 << 20
+    recv_size = 65536
+
+    def __init__(self, sock, source):
+        self.socket = sock
+        self.source = source
+        self.buffer = bytearray()
+
+
+    def receive(self):
+        # returns the packets completed by one read, or None if the peer
+        # closed the connection
+        data = self.socket.recv(self.recv_size)
+        if not data:
+            return None
+        self.buffer += data
+
+        packets = []
+        offset = 0
+        while len(self.buffer) - offset >= 4:
+            size = struct.unpack_from(">i", self.buffer, offset)[0]
+            if size < 0 or size > self.max_packet_size:
+                raise ValueError("invalid packet size %d" % size)
+            if len(self.buffer) - offset - 4 < size:
+                break
+            packets.append(bytes(self.buffer[offset + 4:offset + 4 + size]))
+            offset += 4 + size
+        del self.buffer[:offset]
+        return packets
+
+
+    def close(self):
+        self.socket.close()
+
+
+
+class StreamClient(object):
+    # Sends OSC over a TCP connection, every packet prefixed with its
+    # int32 size. Connecting and writing never block: what the socket
+    # does not accept yet is kept in a buffer of at most max_buffer bytes
+    max_buffer = 65536
+
+    def __init__(self):
+        self.socket = None
+        self.buffer = bytearray()
+
+
+    def connect(self, address):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setblocking(False)
+        error = self.socket.connect_ex(address)
+        if error not in (0, errno.EINPROGRESS):
+            self.close()
+            raise OSError(error, os.strerror(error))
+
+
+    def send(self, data):
+        # raises BlockingIOError if the buffer is full
+        if len(self.buffer) >= self.max_buffer and not self.flush():
+            raise BlockingIOError(errno.EAGAIN, "send buffer full")
+        self.buffer += struct.pack(">i", len(data))
+        self.buffer += data
+        self.flush()
+
+
+    def flush(self):
+        # write what the socket accepts; True if nothing is left
+        while self.buffer:
+            try:
+                sent = self.socket.send(self.buffer)
+            except (BlockingIOError, InterruptedError):
+                return False
+            del self.buffer[:sent]
+        return True
+
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+
+# what an OutboundQueue does with a packet that does not fit
+SEND_POLICIES = ("drop-oldest", "drop-newest", "coalesce")
+
+# errors sending a datagram that are caused by the packet, not the socket
+PACKET_ERRORS = (errno.EMSGSIZE,)
+
+
+class OutboundQueue(object):
+    # Bounded queue of encoded packets for one destination, waiting for
+    # its socket to become writable. When full, 'drop-oldest' drops the
+    # oldest packet and 'drop-newest' the new one. 'coalesce' replaces a
+    # waiting packet for the same OSC address in its place in the queue,
+    # and otherwise drops the oldest
+    def __init__(self, destination, size=1024, policy="drop-oldest"):
+        self.destination = destination
+        self.size = size
+        self.policy = policy
+        self.drops = 0
+        self.packets = collections.OrderedDict()
+        self._seq = 0
+
+
+    def __len__(self):
+        return len(self.packets)
+
+
+    def push(self, key, data):
+        if self.policy == "coalesce" and key is not None:
+            if key in self.packets:
+                self.packets[key] = data
+                self.drops += 1
+                return
+        else:
+            # every packet gets its own key
+            self._seq += 1
+            key = self._seq
+
+        if len(self.packets) >= self.size:
+            self.drops += 1
+            if self.policy == "drop-newest":
+                return
+            self.packets.popitem(last=False)
+        self.packets[key] = data
+
+
+    def peek(self):
+        return next(iter(self.packets.values()))
+
+
+    def pop(self):
+        self.packets.popitem(last=False)
+
 
 
 class OscBridgeNode(ZOCP):
     # Constructor
-    def __init__(self, nodename):
+    def __init__(self, nodename, snapshot_file=None):
         super(OscBridgeNode, self).__init__(nodename)
 
         self.client = None
         self.server = None
+        # (ip, port) that self.server or self.ingress receives on
+        self.receiver_address = None
+
+        # packets are sent without blocking from a bounded queue, with the
+        # client socket polled for writing while packets are waiting. After
+        # an error the client is opened again after client_retry_interval
+        self.send_queue = OutboundQueue(None)
+        self.client_retry_interval = 2.0
+        self._client_writable = False
+        self._client_retry_at = None
+
+        # with receive_workers > 0, OSC on the receive port is received and
+        # decoded by that many worker processes instead of by self.server
+        self.receive_workers = 0
+        self.ingress = None
+
+        # otherwise, with receive_pipeline set, it is received and decoded
+        # in threads feeding bounded queues of receive_queue_size packets
+        self.receive_pipeline = False
+        self.receive_queue_size = 4096
+
+        # callbacks for sockets registered with the poller, see watch()
+        self._watched = {}
 
         self.receive_ip = "0.0.0.0"
         self.receive_port = 1234
         self.send_ip = "127.0.0.1"
         self.send_port = 1235
 
+        # OSC streams (TCP, size-prefixed packets) are accepted on
+        # receive_tcp_port if set; with send_transport 'tcp', OSC is sent
+        # over a TCP connection instead of UDP
+        self.receive_tcp_port = 0
+        self.tcp_server = None
+        self.connections = {}
+        self.send_transport = "udp"
+
+        # additional 'host:port/prefix' endpoints to receive OSC on; the
+        # prefix is prepended to the names of capabilities learned there
+        self.receive_endpoints = ""
+        self.endpoints = {}
+
+        # maximum number of datagrams read from the OSC socket per poll
+        # wakeup, so the ZOCP inbox gets serviced in between bursts
+        self.receive_budget = 64
+
+        # maximum number of receive budgets read from a receive socket
+        # that is being replaced, before closing it
+        self.drain_rounds = 16
+
+        # emitted signals are coalesced per address when a maximum emit
+        # rate (in Hz) is set; 0 emits every received value immediately
+        self.coalescer = SignalCoalescer()
+
+        # senders of OSC; with a source_namespace, capabilities learned from
+        # each sender are prefixed with its address, see SOURCE_NAMESPACES
+        self.sessions = SessionTable()
+        self.source_namespace = ""
+
+        # capabilities can not be unregistered from ZOCP again, so only the
+        # first max_namespaces senders get capabilities of their own; the
+        # namespaces that did are kept here
+        self.max_namespaces = 256
+        self.namespaces = set()
+        self._namespaces_full = False
+
+        # profiling with a SamplingProfiler runs for a number of seconds,
+        # started through 'Profile seconds' or SIGUSR1, and writes its
+        # output to profile_file. The SIGUSR1 handler only sets
+        # _profile_toggle, which tick() acts on
+        self.profiler = SamplingProfiler()
+        self.profile_file = "zosc-profile.txt"
+        self.profile_duration = 30.0
+        self._profile_until = None
+        self._profile_toggle = False
+
+        # a StageTracer while tracing is enabled; while None, tracing costs
+        # a check per decoded packet and one in message_handler
+        self.tracer = None
+
+        # counters published as read-only capabilities every report_interval
+        self.metrics = BridgeMetrics()
+        self.report_interval = 1.0
+        self._next_report = 0
+        self._received_at = 0
+        self._decoded_at = 0
+
+        # values received from OSC are not sent back to OSC, and values
+        # sent to OSC are not emitted again, if they return unchanged
+        # within echo_window seconds; 0 disables echo suppression
+        self.echo_window = 0.0
+        self._emitted = {}
+        self._sent = {}
+
+        # '<pattern> <epsilon>[%] [each]' rules assigning a Deadband to
+        # capabilities; values that did not change enough are not bridged
+        self.deadband_rules = ""
+        self.deadbands = []
+        self._forwarded = {}
+
+        # when sending bundles, all values changed during a loop iteration
+        # are sent as bundles of at most send_mtu bytes
+        self.send_bundles = False
+        self.send_mtu = 1472
+        self._outbound = {}
+
+        # routes by OSC address for received messages (None for dropped
+        # addresses), and lists of routes by capability name for values
+        # changed by ZOCP peers
+        self.routes = {}
+        self.capability_routes = {}
+
+        # addresses whose messages no longer match the typetags their
+        # route was learned with; reported once, then only counted
+        self._mismatched = set()
+
+        # capabilities for new addresses are registered together once per
+        # loop iteration, see commit_capabilities(); until then their type
+        # hint and value, and the first value to emit, are kept here
+        self._pending_capabilities = {}
+        self._first_values = {}
+
+        # messages in bundles with a future timetag, as a heap of
+        # (timetag, sequence, addr, tags, stuff, source, prefix); at most
+        # schedule_size messages up to schedule_horizon seconds ahead
+        self.schedule = []
+        self.schedule_horizon = 60.0
+        self.schedule_size = 10000
+        self._schedule_seq = 0
+
+        # OSC subtrees that are bridged to ZOCP, see AddressFilter; other
+        # messages are dropped before their arguments are decoded
+        self.address_filter = AddressFilter()
+        self.address_filters = ""
+
+        # rules mapping OSC addresses to other capability names, see
+        # RoutingTable; evaluated once for every new address
+        self.routing_rules = ""
+        self.routing = RoutingTable()
+
+        # learned routes and their last values are saved to snapshot_file
+        # (when new routes were learned, at most every snapshot_interval
+        # seconds, and at shutdown) and restored from it at startup
+        self.snapshot_file = snapshot_file
+
+        # datagrams received by the node process are appended to
+        # capture_file if set, see CaptureWriter
+        self.capture_file = ""
+        self.capture = None
+        self.snapshot_interval = 10.0
+        self._snapshot_dirty = False
+        self._next_snapshot = 0
+
 
     def run(self):
+        self.register_settings()
+        self.install_signal_handlers()
+        self.restore_snapshot()
+
+        self.zpoller = zmq.Poller()
+        self.watch(self.inbox, self.handle_inbox)
+
+        self.init_osc()
+
+        while True:
+            try:
+                for sock, events in self.zpoller.poll(self.poll_timeout()):
+                    # a callback may have unwatched a socket polled in the same round
+                    callback = self._watched.get(sock)
+                    if callback is not None:
+                        callback(events)
+                self.tick()
+            except (KeyboardInterrupt, SystemExit):
+                break
+
+        self.shutdown()
+
+
+    def register_settings(self):
         self.register_string("Receive ip", self.receive_ip, 'rw')
         self.register_int("Receive port", self.receive_port, 'rw')
+        self.register_int("Receive TCP port", self.receive_tcp_port, 'rw', 0)
         self.register_string("Send ip", self.send_ip, 'rw')
         self.register_int("Send port", self.send_port, 'rw')
+        self.register_string("Send transport", self.send_transport, 'rw')
+        self.register_string("Receive endpoints", self.receive_endpoints, 'rw')
+        self.register_string("Receive status", "", 'r')
+        self.register_string("Source namespace", self.source_namespace, 'rw')
+        self.register_float("Session TTL", self.sessions.ttl, 'rw', 0)
+        self.register_int("Active sessions", 0, 'r')
+        self.register_string("Sessions", "", 'r')
+        self.register_string("Routing rules", self.routing_rules, 'rw')
+        self.register_string("Address filter", self.address_filters, 'rw')
+        self.register_int("Receive budget", self.receive_budget, 'rw', 1)
+        self.register_int("Receive workers", self.receive_workers, 'rw', 0)
+        self.register_bool("Receive pipeline", self.receive_pipeline, 'rw')
+        self.register_int("Receive queue size", self.receive_queue_size, 'rw', 1)
+        self.register_int("Receive queue depth", 0, 'r')
+        self.register_int("Receive queue drops", 0, 'r')
+        self.register_float("Echo window", self.echo_window, 'rw', 0)
+        self.register_string("Deadbands", self.deadband_rules, 'rw')
+        self.register_float("Emit rate", self.coalescer.rate, 'rw', 0)
+        self.register_bool("Emit rate per address", self.coalescer.per_address, 'rw')
+        self.register_int("Suppressed updates", 0, 'r')
+        self.register_float("Packets in/s", 0, 'r')
+        self.register_float("Packets out/s", 0, 'r')
+        self.register_float("Bytes in/s", 0, 'r')
+        self.register_float("Bytes out/s", 0, 'r')
+        self.register_int("Decode errors", 0, 'r')
+        self.register_int("Dropped messages", 0, 'r')
+        self.register_int("Suppressed echoes", 0, 'r')
+        self.register_int("Unchanged values", 0, 'r')
+        self.register_int("Learned capabilities", 0, 'r')
+        self.register_float("Latency p50 (ms)", 0, 'r')
+        self.register_float("Latency p99 (ms)", 0, 'r')
+        self.register_bool("Trace", False, 'rw')
+        self.register_string("Trace dump file", "", 'rw')
+        self.register_string("Trace stages (ms)", "", 'r')
+        self.register_float("Profile seconds", 0, 'rw', 0)
+        self.register_string("Profile file", self.profile_file, 'rw')
+        self.register_bool("Send bundles", self.send_bundles, 'rw')
+        self.register_int("Send MTU", self.send_mtu, 'rw', 64)
+        self.register_int("Send queue size", self.send_queue.size, 'rw', 1)
+        self.register_string("Send queue policy", self.send_queue.policy, 'rw')
+        self.register_int("Send queue drops", 0, 'r')
+        self.register_string("Capture file", self.capture_file, 'rw')
+        self.register_float("Schedule horizon", self.schedule_horizon, 'rw', 0)
+        self.register_int("Schedule size", self.schedule_size, 'rw', 0)
+        self.register_int("Scheduled messages", 0, 'r')
 
-        self.zpoller = zmq.Poller()
-        self.zpoller.register(self.inbox, zmq.POLLIN)
 
+    def init_osc(self):
         self.init_server(self.receive_ip, self.receive_port)
+        self.init_tcp_server(self.receive_ip, self.receive_tcp_port)
+        self.update_endpoints(self.receive_endpoints)
         self.init_client(self.send_ip, self.send_port)
 
-        while True:
-            try:
-                items = dict(self.zpoller.poll())
-                if self.inbox in items and items[self.inbox] == zmq.POLLIN:
-                    self.get_message()
-                if self.server.socket.fileno() in items and items[self.server.socket.fileno()] == zmq.POLLIN:
-                    self.server.handle_request()
-            except (KeyboardInterrupt, SystemExit):
-                break
 
+    def shutdown(self):
         # Close down OSC after loop stopped running
-        if self.client:
-            self.client.close()
-        if self.server:
-            self.zpoller.unregister(self.server.socket)
-            self.server.close()
+        self.commit_capabilities()
+        self.save_snapshot()
+        self.start_capture("")
+        if self.profiler.running:
+            self.stop_profile()
+        self.close_client()
+        self.close_receiver()
+        self.init_tcp_server(self.receive_ip, 0)
+        for key in list(self.endpoints):
+            self.remove_endpoint(key)
+
+        self.unwatch(self.inbox)
+
+
+    def watch(self, sock, callback, events=zmq.POLLIN):
+        # poll a zmq or a regular socket; callback gets the polled events
+        self.zpoller.register(sock, events)
+        self._watched[self._poll_key(sock)] = callback
+
+
+    def unwatch(self, sock):
+        self.zpoller.unregister(sock)
+        del self._watched[self._poll_key(sock)]
+
+
+    def _poll_key(self, sock):
+        # zmq.Poller reports zmq sockets as is and other sockets by fileno
+        if isinstance(sock, zmq.Socket):
+            return sock
+        return sock.fileno()
+
+
+    def handle_inbox(self, events):
+        self.get_message()
 
-        self.zpoller.unregister(self.inbox)
+
+    def poll_timeout(self):
+        # milliseconds until the next scheduled task
+        deadline = self._next_report
+        coalescer_deadline = self.coalescer.next_deadline()
+        if coalescer_deadline is not None:
+            deadline = min(deadline, coalescer_deadline)
+        if self._client_retry_at is not None:
+            deadline = min(deadline, self._client_retry_at)
+        if self._profile_until is not None:
+            deadline = min(deadline, self._profile_until)
+        timeout = deadline - time.monotonic()
+        if self.schedule:
+            # bundle timetags are in wall clock time
+            timeout = min(timeout, self.schedule[0][0] - time.time())
+        return max(0, timeout) * 1000
+
+
+    def tick(self):
+        # periodic work, run after every poll
+        self.dispatch_scheduled()
+        self.commit_capabilities()
+
+        now = time.monotonic()
+        for addr, data, received in self.coalescer.pop_due(now):
+            self.emit_value(addr, data, received)
+
+        self.flush_outbound()
+
+        if self._client_retry_at is not None and now >= self._client_retry_at:
+            self.init_client(self.send_ip, self.send_port)
+
+        if self._profile_toggle:
+            self._profile_toggle = False
+            self.toggle_profile()
+        elif self._profile_until is not None and now >= self._profile_until:
+            self.stop_profile()
+
+        if now >= self._next_report:
+            self._next_report = now + self.report_interval
+            self.report_metrics(now)
+            if self.capture is not None:
+                self.capture.flush()
+
+        if self._snapshot_dirty and now >= self._next_snapshot:
+            self._next_snapshot = now + self.snapshot_interval
+            self.save_snapshot()
+
+
+    def report_metrics(self, now):
+        report = self.metrics.report(now)
+        self.update_metric("Packets in/s", round(report['packets_in'], 1))
+        self.update_metric("Packets out/s", round(report['packets_out'], 1))
+        self.update_metric("Bytes in/s", round(report['bytes_in'], 1))
+        self.update_metric("Bytes out/s", round(report['bytes_out'], 1))
+        self.update_metric("Decode errors", self.metrics.decode_errors)
+        self.update_metric("Dropped messages", self.metrics.dropped)
+        self.update_metric("Scheduled messages", len(self.schedule))
+        self.update_metric("Send queue drops", self.send_queue.drops)
+        self.update_metric("Suppressed echoes", self.metrics.echoes)
+        self.update_metric("Unchanged values", self.metrics.filtered)
+        self.update_metric("Suppressed updates", self.coalescer.suppressed)
+        self.update_metric("Learned capabilities", len(self.capability_routes))
+        if self.ingress is not None:
+            self.update_metric("Receive queue depth", self.ingress.queue_depth())
+            self.update_metric("Receive queue drops", self.ingress.queue_drops())
+        self.update_metric("Latency p50 (ms)", round(report['p50'] * 1000, 3))
+        self.update_metric("Latency p99 (ms)", round(report['p99'] * 1000, 3))
+
+        if self.tracer is not None:
+            self.update_metric("Trace stages (ms)", self.tracer.summary())
+
+        for session in self.sessions.update(now):
+            print("Session %s:%s ended" % session.source)
+        self.update_metric("Active sessions", len(self.sessions))
+        self.update_metric("Sessions", self.sessions.describe())
+
+
+    def update_metric(self, name, value):
+        # only changed values are signaled to subscribers
+        if self.capability[name]['value'] != value:
+            self.emit_signal(name, value)
 
 
     def on_modified(self, peer, name, data, *args, **kwargs):
@@ -77,10 +1304,21 @@ class OscBridgeNode(ZOCP):
             if new_value != self.receive_ip:
                 self.receive_ip = new_value
                 reinit_receive = True
+                self.init_tcp_server(self.receive_ip, self.receive_tcp_port)
         elif key == "Receive port":
             if new_value != self.receive_port:
                 self.receive_port = new_value
                 reinit_receive = True
+        elif key == "Receive TCP port":
+            if max(0, new_value) != self.receive_tcp_port:
+                self.receive_tcp_port = max(0, new_value)
+                self.init_tcp_server(self.receive_ip, self.receive_tcp_port)
+        elif key == "Send transport":
+            if new_value not in ("udp", "tcp"):
+                print("Unknown send transport '%s', use 'udp' or 'tcp'" % new_value)
+            elif new_value != self.send_transport:
+                self.send_transport = new_value
+                reinit_send = True
         elif key == "Send ip":
             if new_value != self.send_ip:
                 self.send_ip = new_value
@@ -89,19 +1327,98 @@ class OscBridgeNode(ZOCP):
             if new_value != self.send_port:
                 self.send_port = new_value
                 reinit_send = True
-        else:
-            # any other capability is mirrored to OSC
-            if key[0] != '/':
-                # make sure the capability name looks like an OSC path
-                key = '/' + key
-
-            type_hint = self.capability[key]['typeHint']
-            if type_hint.startswith("vec"):
-                stuff = new_value
+        elif key == "Receive endpoints":
+            if new_value != self.receive_endpoints:
+                self.receive_endpoints = new_value
+                self.update_endpoints(self.receive_endpoints)
+        elif key == "Routing rules":
+            if new_value != self.routing_rules:
+                self.routing_rules = new_value
+                self.routing.set_rules(self.routing_rules)
+                self.reroute()
+        elif key == "Address filter":
+            if new_value != self.address_filters:
+                self.address_filters = new_value
+                self.address_filter.set_filters(self.address_filters)
+        elif key == "Receive budget":
+            self.receive_budget = max(1, new_value)
+        elif key == "Receive workers":
+            if max(0, new_value) != self.receive_workers:
+                self.receive_workers = max(0, new_value)
+                reinit_receive = True
+        elif key == "Receive pipeline":
+            if new_value != self.receive_pipeline:
+                self.receive_pipeline = new_value
+                reinit_receive = True
+        elif key == "Receive queue size":
+            if max(1, new_value) != self.receive_queue_size:
+                self.receive_queue_size = max(1, new_value)
+                reinit_receive = self.receive_pipeline
+        elif key == "Echo window":
+            self.echo_window = max(0, new_value)
+            self._emitted.clear()
+            self._sent.clear()
+        elif key == "Deadbands":
+            if new_value != self.deadband_rules:
+                self.deadbands = parse_deadbands(new_value)
+                self.deadband_rules = new_value
+                self._forwarded.clear()
+                for routes in self.capability_routes.values():
+                    for route in routes:
+                        route.deadband = self.deadband_for(route.capability)
+                        route.last_value = None
+        elif key == "Emit rate":
+            self.coalescer.rate = max(0, new_value)
+        elif key == "Emit rate per address":
+            self.coalescer.per_address = new_value
+        elif key == "Send bundles":
+            self.send_bundles = new_value
+            if not self.send_bundles:
+                self.flush_outbound()
+        elif key == "Send MTU":
+            self.send_mtu = max(64, new_value)
+        elif key == "Schedule horizon":
+            self.schedule_horizon = max(0, new_value)
+        elif key == "Schedule size":
+            self.schedule_size = max(0, new_value)
+        elif key == "Send queue size":
+            self.send_queue.size = max(1, new_value)
+        elif key == "Send queue policy":
+            if new_value in SEND_POLICIES:
+                self.send_queue.policy = new_value
             else:
-                stuff = [new_value]
-
-            self.send_message(key, stuff)
+                print("Unknown send queue policy '%s', use one of %s" % (new_value, ", ".join(SEND_POLICIES)))
+        elif key == "Source namespace":
+            if new_value in SOURCE_NAMESPACES:
+                self.source_namespace = new_value
+                self.sessions.set_namespace(new_value)
+            else:
+                print("Unknown source namespace '%s', use one of %s" % (new_value, ", ".join(repr(n) for n in SOURCE_NAMESPACES)))
+        elif key == "Session TTL":
+            self.sessions.ttl = max(0, new_value)
+        elif key == "Trace":
+            if new_value and self.tracer is None:
+                self.tracer = StageTracer()
+            elif not new_value:
+                self.tracer = None
+        elif key == "Trace dump file":
+            if new_value and self.tracer is not None:
+                try:
+                    self.tracer.dump(new_value)
+                except OSError as e:
+                    print("Could not write trace to '%s': %s" % (new_value, e))
+        elif key == "Profile seconds":
+            if new_value > 0:
+                self.start_profile(new_value)
+            elif self.profiler.running:
+                self.stop_profile()
+        elif key == "Profile file":
+            self.profile_file = new_value
+        elif key == "Capture file":
+            if new_value != self.capture_file:
+                self.start_capture(new_value)
+        else:
+            self.mirror_value(key, new_value)
 
 
         if reinit_receive:
@@ -111,73 +1428,890 @@ class OscBridgeNode(ZOCP):
             self.init_client(self.send_ip, self.send_port)
 
 
+    def mirror_value(self, key, value):
+        # capabilities learned from OSC are mirrored to OSC, unless the
+        # value is an echo of what was just received from OSC or did not
+        # change enough since it was last sent
+        routes = self.capability_routes.get(key)
+        if not routes:
+            return
+
+        if self.echo_window > 0 and self.is_echo(self._emitted, key, value):
+            return
+
+        deadband = routes[0].deadband
+        if deadband is not None:
+            if not deadband.changed(self._forwarded.get(key), value):
+                self.metrics.filtered += 1
+                return
+            self._forwarded[key] = value
+
+        for route in routes:
+            self.send_message(route, value)
+
+
     def init_client(self, address, port):
-        if self.client is not None:
-            self.client.close()
+        self.close_client()
+        self._client_retry_at = None
+
+        if self.send_queue.destination != (address, port):
+            # packets still waiting were meant for the previous destination
+            queue = self.send_queue
+            self.send_queue = OutboundQueue((address, port), queue.size, queue.policy)
+
+        print("Connect %s client to %s:%s" %(self.send_transport, address, port))
+        if self.send_transport == "tcp":
+            client = StreamClient()
+        else:
+            client = OSC.OSCClient()
+        try:
+            client.connect((address, port))
+        except (OSC.OSCClientError, OSError) as e:
+            print("Could not connect client to %s:%s: %s" % (address, port, e))
+            client.close()
+            self._client_retry_at = time.monotonic() + self.client_retry_interval
+            return
+        client.socket.setblocking(False)
+        self.client = client
+        self.flush_send_queue()
+
 
-        print("Connect client to %s:%s" %(address, port))
-        self.client = OSC.OSCClient()
-        self.client.connect((address, port))
+    def close_client(self):
+        if self.client is None:
+            return
+        if self._client_writable:
+            self.unwatch(self.client.socket)
+            self._client_writable = False
+        self.client.close()
+        self.client = None
 
 
     def init_server(self, address, port):
+        # the new receiver is bound before the old one is closed, so no
+        # packets are lost in between; if it can not be started, the old
+        # one stays in place. On the same address both share the port
+        # through SO_REUSEPORT, which only the new receiver allows, and
+        # only while binding
+        current = self.server or self.ingress
+        reuse_port = False
+        if current is not None and self.receiver_address == (address, port):
+            reuse_port = current.share()
+
+        server = None
+        ingress = None
+        try:
+            if self.receive_workers > 0:
+                print("Start %d receive workers on %s:%s" % (self.receive_workers, address, port))
+                ingress = ShardedIngress(address, port, self.receive_workers, self.capture is not None)
+            elif self.receive_pipeline:
+                print("Start receive pipeline on %s:%s" % (address, port))
+                ingress = ThreadedIngress(address, port, self.receive_queue_size, reuse_port,
+                        self.capture is not None)
+            else:
+                print("Start server on %s:%s" %(address, port))
+                server = BridgeServer((address, port), reuse_port)
+        except OSError as e:
+            print("Could not receive on %s:%s: %s" % (address, port, e))
+            if reuse_port:
+                current.share(False)
+            self.update_metric("Receive status", "Could not receive on %s:%s: %s" % (address, port, e))
+            return
+
+        self.close_receiver()
+        if ingress is not None:
+            self.ingress = ingress
+            self.watch(self.ingress.socket, self.handle_ingress)
+        else:
+            self.server = self.setup_server(server)
+        self.receiver_address = (address, port)
+        self.update_metric("Receive status", "Receiving on %s:%s" % (address, port))
+
+
+    def close_receiver(self):
+        # handle what is still buffered in the current server or ingress
+        # and close it. Draining is bounded, as a socket sharing its port
+        # with the new one keeps receiving part of the traffic until closed
         if self.server is not None:
-            self.zpoller.unregister(self.server.socket)
+            for i in range(self.drain_rounds):
+                if not self.handle_osc_input(self.server):
+                    break
+            self.unwatch_server(self.server)
             self.server.close()
+            self.server = None
+        if self.ingress is not None:
+            self.ingress.stop()
+            for i in range(self.drain_rounds):
+                if not self.handle_ingress(zmq.POLLIN):
+                    break
+            self.unwatch(self.ingress.socket)
+            self.ingress.close()
+            self.ingress = None
+        self.receiver_address = None
 
+
+    def create_server(self, address, port, prefix=""):
         print("Start server on %s:%s" %(address, port))
-        self.server = OSC.OSCServer((address, port))
-        self.server.addMsgHandler("default", self.message_handler)
-        self.zpoller.register(self.server.socket, zmq.POLLIN)
+        return self.setup_server(BridgeServer((address, port)), prefix)
 
 
-    def send_message(self, addr, stuff):
-        osc_message = OSC.OSCMessage()
-        osc_message.setAddress(addr)
-        osc_message.append(stuff)
-        if self.client:
-            try:
-                self.client.send(osc_message, 1)
-            except:
-                print("Could not send message to OSC server")
-                self.client.close()
-                self.client = None
-
-
-    def message_handler(self, addr, tags, stuff, source):
-        if not (type(stuff) is list and len(stuff)>0):
-            # ignore messages without data
-            return
-
-        if not addr in self.capability:
-            # add ZOCP capability for each path
-            if tags == 'f' or tags == 'd':
-                self.register_float(addr, 0, 'rwes')
-            elif tags == 'ff' or tags == 'dd':
-                self.register_vec2f(addr, [0,0], 'rwes')
-            elif tags == 'fff' or tags == 'ddd':
-                self.register_vec3f(addr, [0,0,0], 'rwes')
-            elif tags == 'ffff' or tags == 'dddd':
-                self.register_vec4f(addr, [0,0,0,0], 'rwes')
-
-            elif tags == 'i':
-                self.register_int(addr, 0, 'rwes')
+    def setup_server(self, server, prefix=""):
+        server.prefix = prefix
+        self.watch_server(server)
+        return server
+
+
+    def update_endpoints(self, endpoints):
+        # open and close additional receive endpoints, leaving the ones
+        # that are still configured untouched
+        wanted = parse_endpoints(endpoints)
+        for key in list(self.endpoints):
+            if key not in wanted:
+                self.remove_endpoint(key)
+
+        for key, prefix in wanted.items():
+            if key == (self.receive_ip, self.receive_port):
+                print("Could not start server on %s:%s: this is the receive address" % key)
+            elif key in self.endpoints:
+                self.endpoints[key].prefix = prefix
             else:
-                self.register_string(addr, "", 'rwes')
+                self.add_endpoint(key, prefix)
+
+
+    def add_endpoint(self, key, prefix=""):
+        try:
+            self.endpoints[key] = self.create_server(key[0], key[1], prefix)
+        except socket.error as e:
+            print("Could not start server on %s:%s: %s" % (key[0], key[1], e))
+
+
+    def remove_endpoint(self, key):
+        server = self.endpoints.pop(key)
+        print("Stop server on %s:%s" % key)
+        self.unwatch_server(server)
+        server.close()
+
+
+    def watch_server(self, server):
+        # the socket is drained in handle_osc_input until it would block
+        server.socket.setblocking(False)
+        self.watch(server.socket, lambda events: self.handle_osc_input(server))
+
+
+    def unwatch_server(self, server):
+        self.unwatch(server.socket)
+
+
+    def handle_osc_input(self, server):
+        # read and dispatch all pending datagrams, up to the receive budget;
+        # anything left in the socket buffer wakes up the next poll. Returns
+        # True if the budget ran out
+        for i in range(self.receive_budget):
+            try:
+                data, source = server.socket.recvfrom(server.max_packet_size)
+            except (BlockingIOError, InterruptedError):
+                return False
+            except socket.error as e:
+                print("Could not receive OSC data: %s" % e)
+                return False
+
+            self.handle_datagram(server, data, source)
+        return True
+
+
+    def handle_ingress(self, events):
+        # dispatch records decoded by the receive workers or pipeline, up to
+        # the receive budget, like handle_osc_input does for datagrams
+        records = self.ingress.receive_batch(self.receive_budget)
+        for record in records:
+            host, port, received, size, dropped, messages, raw = record
+            self._received_at = received
+            self.metrics.packets_in += 1
+            self.metrics.bytes_in += size
+            self.metrics.dropped += dropped
+            self.sessions.touch((host, port), size, received, self.source_namespace)
+            if raw is not None and self.capture is not None:
+                self.capture.write(received, (host, port), raw)
+            if messages is None:
+                self.metrics.decode_errors += 1
+                continue
+            # decoded by the worker or pipeline; what is measured as
+            # decoding includes handing the record over
+            if self.tracer is not None:
+                self._decoded_at = time.monotonic()
+            self.dispatch_messages(messages, (host, port))
+        return len(records) == self.receive_budget
+
+
+    def dispatch_messages(self, messages, source, prefix=""):
+        # handle (addr, tags, stuff, timetag) messages as produced by
+        # flatten(), scheduling the ones that are not due yet
+        for addr, tags, stuff, timetag in messages:
+            if timetag > time.time():
+                self.schedule_message(timetag, addr, tags, stuff, source, prefix)
+                continue
+            try:
+                self.message_handler(addr, tags, stuff, source, prefix)
+            except Exception as e:
+                self.metrics.decode_errors += 1
+                print("Could not handle OSC message '%s' from %s:%s: %s" % (addr, source[0], source[1], e))
+
+
+    def decode_packet(self, data, source):
+        # returns the messages in a packet as produced by flatten(), or
+        # None if it could not be decoded; _decoded_at is set while tracing
+        try:
+            messages = flatten(OSC.decodeOSC(data))
+        except Exception as e:
+            self.metrics.decode_errors += 1
+            print("Could not decode OSC packet from %s:%s: %s" % (source[0], source[1], e))
+            return None
+        if self.tracer is not None:
+            self._decoded_at = time.monotonic()
+        return messages
+
+
+    def accept_packet(self, data, source):
+        # bookkeeping for a received packet; False if it is filtered out
+        self._received_at = time.monotonic()
+        self.metrics.packets_in += 1
+        self.metrics.bytes_in += len(data)
+        self.sessions.touch(source, len(data), self._received_at, self.source_namespace)
+        if self.capture is not None:
+            self.capture.write(self._received_at, source, data)
+
+        if self.address_filter.active and data[:1] == b'/':
+            # only the address of a single message is read here; bundle
+            # elements are filtered in message_handler
+            address = data[:data.find(b'\0')].decode('latin1')
+            if not self.address_filter.accepts(address):
+                self.metrics.dropped += 1
+                return False
+        return True
+
+
+    def handle_datagram(self, server, data, source):
+        # decode and dispatch a single OSC packet received by server
+        if not self.accept_packet(data, source):
+            return
+
+        messages = self.decode_packet(data, source)
+        if messages is not None:
+            self.dispatch_messages(messages, source, server.prefix)
+
+
+    def init_tcp_server(self, address, port):
+        # (re)open the listening socket for OSC streams; port 0 closes it
+        # and all connections accepted on it
+        for connection in list(self.connections.values()):
+            self.close_connection(connection)
+        if self.tcp_server is not None:
+            self.unwatch(self.tcp_server)
+            self.tcp_server.close()
+            self.tcp_server = None
+
+        if not port:
+            return
+
+        print("Start TCP server on %s:%s" % (address, port))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((address, port))
+            sock.listen(16)
+        except OSError as e:
+            print("Could not start TCP server on %s:%s: %s" % (address, port, e))
+            sock.close()
+            return
+        sock.setblocking(False)
+        self.tcp_server = sock
+        self.watch(sock, self.handle_tcp_accept)
+
+
+    def handle_tcp_accept(self, events):
+        while True:
+            try:
+                sock, source = self.tcp_server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print("Could not accept OSC stream: %s" % e)
+                return
+
+            sock.setblocking(False)
+            connection = StreamConnection(sock, source)
+            self.connections[sock.fileno()] = connection
+            self.watch(sock, lambda events, connection=connection: self.handle_tcp_input(connection))
+
 
-        type_hint = self.capability[addr]['typeHint']
+    def handle_tcp_input(self, connection):
+        try:
+            packets = connection.receive()
+        except (BlockingIOError, InterruptedError):
+            return
+        except (OSError, ValueError) as e:
+            print("Closing OSC stream from %s:%s: %s" % (connection.source[0], connection.source[1], e))
+            packets = None
+
+        if packets is None:
+            self.close_connection(connection)
+            return
+
+        for data in packets:
+            if not self.accept_packet(data, connection.source):
+                continue
+            messages = self.decode_packet(data, connection.source)
+            if messages is not None:
+                self.dispatch_messages(messages, connection.source)
+
+
+    def close_connection(self, connection):
+        del self.connections[connection.socket.fileno()]
+        self.unwatch(connection.socket)
+        connection.close()
+
+
+    def schedule_message(self, timetag, addr, tags, stuff, source, prefix=""):
+        # keep a message until its timetag, unless it is too far ahead or
+        # the schedule is full
+        if timetag - time.time() > self.schedule_horizon or len(self.schedule) >= self.schedule_size:
+            self.metrics.dropped += 1
+            return
+
+        self._schedule_seq += 1
+        heapq.heappush(self.schedule, (timetag, self._schedule_seq, addr, tags, stuff, source, prefix))
+
+
+    def dispatch_scheduled(self):
+        now = time.time()
+        while self.schedule and self.schedule[0][0] <= now:
+            timetag, seq, addr, tags, stuff, source, prefix = heapq.heappop(self.schedule)
+            # latency of scheduled messages counts from when they are due
+            self._received_at = self._decoded_at = time.monotonic()
+            try:
+                self.message_handler(addr, tags, stuff, source, prefix)
+            except Exception as e:
+                self.metrics.decode_errors += 1
+                print("Could not handle OSC message '%s' from %s:%s: %s" % (addr, source[0], source[1], e))
+
+
+    def install_signal_handlers(self):
+        # SIGUSR1 starts profiling for profile_duration seconds, or stops
+        # profiling early. Signal handlers can only be installed from the
+        # main thread, so a bridge running in another thread goes without
+        if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self.handle_profile_signal)
+
+
+    def handle_profile_signal(self, signum, frame):
+        # runs between any two bytecodes of the main thread, possibly in the
+        # middle of a ZOCP send, so the profile is toggled from tick()
+        self._profile_toggle = True
+
+
+    def toggle_profile(self):
+        if self.profiler.running:
+            self.stop_profile()
+        else:
+            self.start_profile(self.profile_duration)
+
+
+    def start_profile(self, seconds):
+        self._profile_until = time.monotonic() + seconds
+        if self.profiler.running:
+            return
+        try:
+            self.profiler.start()
+        except ValueError as e:
+            print("Could not start profiler: %s" % e)
+            self._profile_until = None
+            return
+        print("Profiling for %s seconds" % seconds)
+
+
+    def stop_profile(self):
+        self._profile_until = None
+        self.profiler.stop()
+        try:
+            self.profiler.write(self.profile_file)
+            print("Profile written to '%s'" % self.profile_file)
+        except OSError as e:
+            print("Could not write profile to '%s': %s" % (self.profile_file, e))
+        self.update_metric("Profile seconds", 0)
+
+
+    def start_capture(self, path):
+        # stop the current capture, and start capturing to path if set
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
+        self.capture_file = path
+        if path:
+            try:
+                self.capture = CaptureWriter(path)
+            except OSError as e:
+                print("Could not capture to '%s': %s" % (path, e))
+        if self.ingress is not None:
+            self.ingress.set_capture(self.capture is not None)
+
+
+    def send_message(self, route, value):
+        if self.echo_window > 0:
+            sent = value[route.index] if route.index is not None else value
+            self._sent[route.address] = (sent, time.monotonic())
+
+        if self.send_bundles:
+            # collected until the end of this loop iteration, see tick()
+            self._outbound[route.address] = (route, value)
+            return
+
+        osc_message = OSC.OSCMessage(route.address)
+        route.encode(osc_message, value)
+        self.send_packet(osc_message, route.address)
+
+
+    def flush_outbound(self):
+        # send the values collected during this loop iteration as bundles,
+        # each bundle staying below the configured MTU
+        if not self._outbound:
+            return
+
+        messages = []
+        for route, value in self._outbound.values():
+            osc_message = OSC.OSCMessage(route.address)
+            route.encode(osc_message, value)
+            messages.append(osc_message)
+        self._outbound.clear()
+
+        batch = []
+        size = BUNDLE_HEADER_SIZE
+        for osc_message in messages:
+            # every bundle element is prefixed with its int32 size
+            element_size = 4 + len(osc_message.getBinary())
+            if batch and size + element_size > self.send_mtu:
+                self.send_batch(batch)
+                batch = []
+                size = BUNDLE_HEADER_SIZE
+            batch.append(osc_message)
+            size += element_size
+
+        self.send_batch(batch)
+
+
+    def send_batch(self, messages):
+        # a single message is sent as is, multiple messages as a bundle
+        if len(messages) == 1:
+            self.send_packet(messages[0], messages[0].address)
+            return
+
+        bundle = OSC.OSCBundle()
+        for osc_message in messages:
+            bundle.append(osc_message)
+        self.send_packet(bundle)
+
+
+    def send_packet(self, packet, key=None):
+        # queue a packet and send what the socket accepts right away; key
+        # is the OSC address of a single message, used for coalescing
+        self.send_queue.push(key, packet.getBinary())
+        self.flush_send_queue()
+
+
+    def flush_send_queue(self, events=zmq.POLLOUT):
+        client = self.client
+        if client is None:
+            return
+
+        # a stream client frames packets itself and buffers what the
+        # socket does not take
+        stream = isinstance(client, StreamClient)
+        send = client.send if stream else client.socket.send
+
+        queue = self.send_queue
+        try:
+            flushed = client.flush() if stream else True
+            while queue:
+                data = queue.peek()
+                try:
+                    send(data)
+                except ConnectionRefusedError:
+                    if stream:
+                        raise
+                    # nothing listening at the destination (yet), which is
+                    # no reason to stop sending
+                    queue.drops += 1
+                except OSError as e:
+                    if stream or e.errno not in PACKET_ERRORS:
+                        raise
+                    # only this packet can not be sent; drop it and carry on
+                    print("Could not send %d bytes to OSC server: %s" % (len(data), e))
+                    queue.drops += 1
+                else:
+                    self.metrics.packets_out += 1
+                    self.metrics.bytes_out += len(data)
+                queue.pop()
+            if stream:
+                flushed = client.flush()
+        except (BlockingIOError, InterruptedError):
+            flushed = False
+        except OSError as e:
+            print("Could not send message to OSC server: %s" % e)
+            self.close_client()
+            self._client_retry_at = time.monotonic() + self.client_retry_interval
+            return
+
+        # poll for writability only while packets are waiting
+        waiting = bool(queue) or not flushed
+        if waiting and not self._client_writable:
+            self.watch(client.socket, self.flush_send_queue, zmq.POLLOUT)
+            self._client_writable = True
+        elif not waiting and self._client_writable:
+            self.unwatch(client.socket)
+            self._client_writable = False
+
+
+    def message_handler(self, addr, tags, stuff, source, prefix=""):
+        if self.tracer is not None:
+            self.trace_message(addr, tags, stuff, source, prefix)
+            return
+
+        routed = self.route_message(addr, tags, stuff, source, prefix)
+        if routed is not None:
+            self.forward_value(*routed)
 
-        if type_hint.startswith("vec"):
-            data = stuff
+
+    def trace_message(self, addr, tags, stuff, source, prefix=""):
+        # message_handler with timestamps after dispatch to a route and
+        # emitting; the packet was decoded at _decoded_at, unless this
+        # message did not come through decode_packet
+        decoded = self._decoded_at
+        if decoded < self._received_at:
+            decoded = time.monotonic()
+        routed = self.route_message(addr, tags, stuff, source, prefix)
+        if routed is None:
+            return
+        dispatched = time.monotonic()
+        emitted = None
+        if self.forward_value(*routed):
+            emitted = time.monotonic()
+        self.tracer.record(addr, self._received_at, decoded, dispatched, emitted)
+
+
+    def route_message(self, addr, tags, stuff, source, prefix=""):
+        # returns the route for a received message and the value to
+        # forward, or None if the message is not forwarded
+        if self.address_filter.active and not self.address_filter.accepts(addr):
+            self.metrics.dropped += 1
+            return None
+
+        session = self.sessions.get(source)
+        if session is not None:
+            session.addresses.add(addr)
+            namespace = session.prefix
         else:
-            data = stuff[0]
+            namespace = source_prefix(source, self.source_namespace)
+        prefix += namespace
+
+        route = self.routes.get(prefix + addr)
+        if route is None:
+            if not (type(stuff) is list and len(stuff)>0) or prefix + addr in self.routes:
+                # ignore messages without data, or dropped by a routing rule
+                self.metrics.dropped += 1
+                return None
+            if namespace and not namespace in self.namespaces and not self.add_namespace(namespace):
+                self.metrics.dropped += 1
+                return None
+            route = self.add_route(addr, tags, prefix, namespace)
+            if route is None:
+                self.metrics.dropped += 1
+                return None
+        elif not stuff:
+            self.metrics.dropped += 1
+            return None
+
+        try:
+            data = route.decode(stuff)
+        except (TypeError, ValueError, AttributeError):
+            self.metrics.decode_errors += 1
+            if not prefix + addr in self._mismatched:
+                self._mismatched.add(prefix + addr)
+                print("Ignoring '%s' messages with typetags '%s', '%s' is a %s" % (prefix + addr, tags,
+                        route.capability, route.type_hint))
+            return None
+
+        if self.echo_window > 0 and self.is_echo(self._sent, route.address, data):
+            return None
+
+        if route.deadband is not None:
+            if not route.deadband.changed(route.last_value, data):
+                self.metrics.filtered += 1
+                return None
+            route.last_value = data
+
+        if route.index is not None:
+            route.vector[route.index] = data
+            data = list(route.vector)
+
+        return route, data
+
+
+    def add_namespace(self, namespace):
+        # returns False if no more senders can get their own capabilities
+        if len(self.namespaces) < self.max_namespaces:
+            self.namespaces.add(namespace)
+            return True
+        if not self._namespaces_full:
+            print("Not learning capabilities from more than %d senders" % self.max_namespaces)
+            self._namespaces_full = True
+        return False
+
+
+    def forward_value(self, route, data):
+        # emit now or coalesce; returns True if the value was emitted
+        if self.coalescer.push(route.capability, data, self._received_at):
+            return self.emit_value(route.capability, data, self._received_at)
+        return False
+
+
+    def emit_value(self, capability, data, received):
+        pending = self._pending_capabilities.get(capability)
+        if pending is not None:
+            # not registered yet; emitted by commit_capabilities()
+            self._pending_capabilities[capability] = (pending[0], data)
+            self._first_values[capability] = (data, received)
+            return False
+
+        self.emit_signal(capability, data)
+        now = time.monotonic()
+        self.metrics.latency.record(now - received)
+        if self.echo_window > 0:
+            self._emitted[capability] = (data, now)
+        return True
+
+
+    def is_echo(self, records, key, value):
+        # True if value is what was passed the other way within the window
+        record = records.get(key)
+        if record is None or time.monotonic() - record[1] > self.echo_window:
+            return False
+        if not same_value(record[0], value):
+            return False
+
+        self.metrics.echoes += 1
+        return True
+
+
+    def add_route(self, addr, tags, prefix="", namespace=""):
+        # route a new address to a ZOCP capability, registering it if needed
+        key = prefix + addr
+        self.routes[key] = None
+        self._mismatched.discard(key)
+        try:
+            target = self.routing.match(key)
+        except ValueError as e:
+            print("Could not route '%s': %s" % (key, e))
+            return None
+
+        if target is None:
+            # by default, add ZOCP capability for each path
+            route = Route(addr, key, tags, namespace=namespace)
+        elif target[0] is None:
+            return None
+        else:
+            name, index, size = target
+            vector = None
+            if index is not None:
+                vector = self._folded_vector(name, size)
+            route = Route(addr, name, tags, index, vector, namespace)
+        route.deadband = self.deadband_for(route.capability)
+
+        routes = self.capability_routes.get(route.capability)
+        if routes is None:
+            if route.capability in self.capability:
+                print("Could not route '%s': capability '%s' already exists" % (key, route.capability))
+                return None
+            value = INITIAL_VALUES[route.type_hint]
+            if route.vector is not None:
+                value = list(route.vector)
+            elif isinstance(value, list):
+                value = list(value)
+            self._pending_capabilities[route.capability] = (route.type_hint, value)
+            routes = self.capability_routes[route.capability] = []
+        elif self._type_hint(route.capability) != route.type_hint:
+            print("Could not route '%s': capability '%s' is a %s" % (key, route.capability,
+                    self._type_hint(route.capability)))
+            return None
+
+        if not any(known.address == addr for known in routes):
+            routes.append(route)
+        self.routes[key] = route
+        self._snapshot_dirty = True
+        return route
+
+
+    def reroute(self):
+        # route all known addresses again by the current rules; addresses
+        # that were dropped are routed when they are received again
+        routes = self.routes
+        self.routes = {}
+        for key, route in routes.items():
+            if route is None:
+                continue
+            known = self.capability_routes[route.capability]
+            if route in known:
+                known.remove(route)
+
+        for key, route in routes.items():
+            if route is not None:
+                self.add_route(route.address, route.tags, key[:len(key) - len(route.address)], route.namespace)
+
+
+    def deadband_for(self, capability):
+        for regex, deadband in self.deadbands:
+            if regex.fullmatch(capability):
+                return deadband
+        return None
+
+
+    def _type_hint(self, name):
+        # type of a learned capability, which may have no routes left after
+        # the routing rules changed
+        if name in self._pending_capabilities:
+            return self._pending_capabilities[name][0]
+        return self.capability[name]['typeHint']
+
+
+    def _folded_vector(self, name, size):
+        # element routes into the same capability share one value list,
+        # starting from its current value if it is already registered
+        for route in self.capability_routes.get(name, ()):
+            if route.vector is not None:
+                return route.vector
+        value = self.capability.get(name, {}).get('value')
+        if name in self.capability_routes and isinstance(value, list) and len(value) == size:
+            return [float(element) for element in value]
+        return [0.0] * size
+
+
+    def register_capabilities(self, capabilities):
+        # register {name: (type_hint, value)} with a single update to the
+        # peers, where every register_* call would send one of its own
+        data = {}
+        for name, (type_hint, value) in capabilities.items():
+            data[name] = {'value': value, 'typeHint': type_hint, 'access': 'rwes', 'subscribers': []}
+            self.capability[name] = data[name]
+        if data:
+            self._on_modified(data=data)
+
+
+    def commit_capabilities(self):
+        # register the capabilities learned since the last call, so a
+        # device dumping its state causes one update to the peers instead
+        # of one per address, then emit their first values
+        if not self._pending_capabilities:
+            return
+
+        batch = self._pending_capabilities
+        first_values = self._first_values
+        self._pending_capabilities = {}
+        self._first_values = {}
+
+        self.register_capabilities(batch)
+        for capability, (data, received) in first_values.items():
+            self.emit_value(capability, data, received)
+
+
+    def save_snapshot(self):
+        self._snapshot_dirty = False
+        if not self.snapshot_file:
+            return
+
+        routes = []
+        for key, route in self.routes.items():
+            if route is None:
+                continue
+            size = None
+            if route.vector is not None:
+                size = len(route.vector)
+            value = self.capability[route.capability]['value']
+            routes.append([key, route.address, route.capability, route.tags, route.index, size, value,
+                    route.namespace])
+
+        # write to a temporary file first, so a crash can not leave a
+        # truncated snapshot behind
+        path = self.snapshot_file + ".tmp"
+        try:
+            with open(path, 'w') as f:
+                json.dump({'version': SNAPSHOT_VERSION, 'routes': routes}, f, separators=(',', ':'))
+            os.replace(path, self.snapshot_file)
+        except (OSError, TypeError, ValueError) as e:
+            print("Could not save snapshot to '%s': %s" % (self.snapshot_file, e))
+
+
+    def restore_snapshot(self):
+        # register the routes saved by save_snapshot in one batch, before
+        # OSC is received
+        if not self.snapshot_file:
+            return
+        try:
+            with open(self.snapshot_file) as f:
+                snapshot = json.load(f)
+            version = snapshot['version']
+            routes = list(snapshot['routes'])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print("Could not restore snapshot from '%s': %s" % (self.snapshot_file, e))
+            return
+        if version != SNAPSHOT_VERSION:
+            print("Could not restore snapshot from '%s': unsupported version %s" % (self.snapshot_file, version))
+            return
+
+        batch = {}
+        for entry in routes:
+            # a bad entry is skipped, the others are restored
+            try:
+                key, addr, name, tags, index, size, value, namespace = entry
+                if not all(isinstance(field, str) for field in (key, addr, name, tags, namespace)):
+                    raise TypeError("address, capability, typetags and namespace must be strings")
+                vector = None
+                if index is not None:
+                    vector = self._folded_vector(name, size)
+                    if len(value) != len(vector):
+                        raise ValueError("value does not match vector size %d" % len(vector))
+                route = Route(addr, name, tags, index, vector, namespace)
+            except (TypeError, ValueError, IndexError) as e:
+                print("Could not restore snapshot entry %s: %s" % (json.dumps(entry), e))
+                continue
+            # restored senders count towards max_namespaces, like new ones
+            if namespace and not namespace in self.namespaces and not self.add_namespace(namespace):
+                continue
+            route.deadband = self.deadband_for(name)
+
+            known = self.capability_routes.get(name)
+            if known is None:
+                if name in self.capability:
+                    print("Could not restore '%s': capability '%s' already exists" % (key, name))
+                    continue
+                if vector is not None:
+                    vector[:] = value
+                batch[name] = (route.type_hint, value)
+                known = self.capability_routes[name] = []
+            elif known[0].type_hint != route.type_hint:
+                continue
+
+            if not any(other.address == addr for other in known):
+                known.append(route)
+            self.routes[key] = route
 
-        self.emit_signal(addr, data)
+        self.register_capabilities(batch)
 
 
 
 if __name__ == '__main__':
-    z = OscBridgeNode("zosc_brigde@%s" % socket.gethostname())
+    # optional argument: file to keep learned capabilities in across restarts
+    snapshot_file = sys.argv[1] if len(sys.argv) > 1 else None
+    z = OscBridgeNode("zosc_brigde@%s" % socket.gethostname(), snapshot_file)
     z.start()
     z.run()
     z.stop()
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+import asyncio
+import socket
+import sys
+
+import zmq
+import zmq.asyncio
+
+from zosc import OscBridgeNode
+
+
+class OscDatagramProtocol(asyncio.DatagramProtocol):
+    # Hands datagrams received on an OSCServer socket to the bridge
+    def __init__(self, node, server):
+        self.node = node
+        self.server = server
+
+
+    def datagram_received(self, data, source):
+        self.node.handle_datagram(self.server, data, source)
+        self.node.schedule_tick()
+
+
+    def error_received(self, exc):
+        print("Could not receive OSC data: %s" % exc)
+
+
+
+class AsyncOscBridgeNode(OscBridgeNode):
+    # OscBridgeNode running on an asyncio event loop: OSC is received
+    # through a DatagramProtocol, the ZOCP inbox through zmq.asyncio, and
+    # periodic work runs as timers on the same loop instead of being
+    # driven by poll timeouts. Outbound packets are sent like the base
+    # class does, with the client socket watched through add_writer
+    def __init__(self, nodename, snapshot_file=None):
+        super(AsyncOscBridgeNode, self).__init__(nodename, snapshot_file)
+
+        self.loop = None
+        # datagram transports by id() of their OSCServer, which is unhashable
+        self._transports = {}
+        self._tick_handle = None
+        self._timer_handle = None
+
+
+    def run(self):
+        try:
+            asyncio.run(self.run_async())
+        except (KeyboardInterrupt, SystemExit):
+            pass
+
+
+    async def run_async(self):
+        self.loop = asyncio.get_running_loop()
+
+        self.register_settings()
+        self.install_signal_handlers()
+        self.restore_snapshot()
+        self.watch(self.inbox, self.handle_inbox)
+
+        self.init_osc()
+
+        try:
+            # everything else happens in callbacks and tasks
+            await self.loop.create_future()
+        finally:
+            for handle in (self._tick_handle, self._timer_handle):
+                if handle is not None:
+                    handle.cancel()
+            self.shutdown()
+
+
+    def watch(self, sock, callback, events=zmq.POLLIN):
+        if isinstance(sock, zmq.Socket):
+            self._watched[sock] = self.loop.create_task(self.watch_zmq(sock, callback, events))
+            return
+
+        if events & zmq.POLLIN:
+            self.loop.add_reader(sock, self._ready, callback, zmq.POLLIN)
+        if events & zmq.POLLOUT:
+            self.loop.add_writer(sock, self._ready, callback, zmq.POLLOUT)
+        self._watched[sock.fileno()] = callback
+
+
+    def unwatch(self, sock):
+        if isinstance(sock, zmq.Socket):
+            self._watched.pop(sock).cancel()
+            return
+
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        del self._watched[sock.fileno()]
+
+
+    async def watch_zmq(self, sock, callback, events):
+        async_sock = zmq.asyncio.Socket.from_socket(sock)
+        while True:
+            ready = await async_sock.poll(flags=events)
+            if ready:
+                self._ready(callback, ready)
+
+
+    def _ready(self, callback, events):
+        callback(events)
+        self.schedule_tick()
+
+
+    def watch_server(self, server):
+        server.socket.setblocking(False)
+        self._transports[id(server)] = None
+        self.loop.create_task(self.open_endpoint(server))
+
+
+    async def open_endpoint(self, server):
+        transport, protocol = await self.loop.create_datagram_endpoint(
+            lambda: OscDatagramProtocol(self, server), sock=server.socket)
+        if id(server) in self._transports:
+            self._transports[id(server)] = transport
+        else:
+            # the server was replaced while the endpoint was being created
+            transport.close()
+
+
+    def unwatch_server(self, server):
+        # the transport owns the socket from here on and closes it
+        transport = self._transports.pop(id(server), None)
+        if transport is not None:
+            transport.close()
+
+
+    def schedule_tick(self):
+        # run tick() once after the callbacks that are ready now
+        if self._tick_handle is None:
+            self._tick_handle = self.loop.call_soon(self.run_tick)
+
+
+    def run_tick(self):
+        self._tick_handle = None
+        self.tick()
+
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+            self._timer_handle = None
+
+        timeout = self.poll_timeout()
+        if timeout is not None:
+            self._timer_handle = self.loop.call_later(timeout / 1000.0, self.schedule_tick)
+
+
+
+if __name__ == '__main__':
+    snapshot_file = sys.argv[1] if len(sys.argv) > 1 else None
+    z = AsyncOscBridgeNode("zosc_brigde@%s" % socket.gethostname(), snapshot_file)
+    z.start()
+    z.run()
+    z.stop()
+    del z
+
+    print("ZOCP Stopped")
@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+
+# Measures OscBridgeNode throughput on a single machine, without a ZOCP
+# network: the node runs on MockZOCP, which records registrations and
+# emitted signals in memory, while threads send OSC to its receive port.
+#
+#   zosc_bench.py [--threads 4] [--addresses 100] [--typetags f]
+#                 [--rate 0] [--duration 5] [--workers 0] [--pipeline]
+#
+# Every message carries a sequence number as its first argument, so
+# emitted signals can be matched to the time they were sent.
+
+import argparse
+import socket
+import sys
+import threading
+import time
+
+import zmq
+
+
+class MockZOCP(object):
+    # In-memory stand-in for the ZOCP node the bridge is based on
+    def __init__(self, nodename=None):
+        self.nodename = nodename
+        self.capability = {}
+        self._cur_obj = self.capability
+        self._running = False
+
+        self.registered = []
+        self.modified = 0
+        self.signals = []
+
+        # the bridge polls the inbox; a message on it stops the bridge
+        self.ctx = zmq.Context.instance()
+        self.inbox = self.ctx.socket(zmq.PAIR)
+        self.inbox.bind("inproc://zosc-bench-%d" % id(self))
+        self.control = self.ctx.socket(zmq.PAIR)
+        self.control.connect("inproc://zosc-bench-%d" % id(self))
+
+
+    def name(self):
+        return self.nodename
+
+
+    def start(self):
+        self._running = True
+
+
+    def stop(self):
+        self._running = False
+        self.control.send(b"stop")
+
+
+    def get_message(self):
+        self.inbox.recv()
+        raise SystemExit
+
+
+    def _register_param(self, name, value, type_hint, access='r', min=None, max=None, step=None):
+        self._cur_obj[name] = {'value': value, 'typeHint': type_hint, 'access': access, 'subscribers': []}
+        self.registered.append(name)
+        self._on_modified(data={name: self._cur_obj[name]})
+
+
+    def _on_modified(self, data, peer=None, name=None):
+        self.modified += 1
+
+
+    def register_int(self, name, value, access='r', min=None, max=None, step=None):
+        self._register_param(name, value, 'int', access, min, max, step)
+
+
+    def register_float(self, name, value, access='r', min=None, max=None, step=None):
+        self._register_param(name, value, 'flt', access, min, max, step)
+
+
+    def register_percent(self, name, value, access='r', min=None, max=None, step=None):
+        self._register_param(name, value, 'percent', access, min, max, step)
+
+
+    def register_bool(self, name, value, access='r'):
+        self._register_param(name, value, 'bool', access)
+
+
+    def register_string(self, name, value, access='r'):
+        self._register_param(name, value, 'string', access)
+
+
+    def register_vec2f(self, name, value, access='r', min=None, max=None, step=None):
+        self._register_param(name, value, 'vec2f', access, min, max, step)
+
+
+    def register_vec3f(self, name, value, access='r', min=None, max=None, step=None):
+        self._register_param(name, value, 'vec3f', access, min, max, step)
+
+
+    def register_vec4f(self, name, value, access='r', min=None, max=None, step=None):
+        self._register_param(name, value, 'vec4f', access, min, max, step)
+
+
+    def emit_signal(self, name, data):
+        self.capability[name]['value'] = data
+        self.signals.append((name, data, time.monotonic()))
+
+
+
+# the bridge has to be imported after the stand-in is in place
+sys.modules['zocp'] = type(sys)('zocp')
+sys.modules['zocp'].ZOCP = MockZOCP
+
+import OSC
+from zosc import OscBridgeNode
+
+
+class LoadGenerator(threading.Thread):
+    # Sends messages to addresses /bench/<index>/<n> round robin, at rate
+    # messages per second or as fast as possible with rate 0, and keeps
+    # the send time of every sequence number
+    def __init__(self, index, address, addresses, typetags, rate, duration):
+        super(LoadGenerator, self).__init__(daemon=True)
+        self.index = index
+        self.address = address
+        self.addresses = ["/bench/%d/%d" % (index, n) for n in range(addresses)]
+        self.typetags = typetags
+        self.rate = rate
+        self.duration = duration
+        self.sent = []
+
+
+    def message(self, addr, seq):
+        message = OSC.OSCMessage(addr)
+        for i, tag in enumerate(self.typetags):
+            value = seq if i == 0 else 0
+            if tag == 'f':
+                message.append(float(value), 'f')
+            elif tag == 'i':
+                message.append(int(value), 'i')
+            else:
+                message.append(str(value), 's')
+        return message.getBinary()
+
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        interval = 1.0 / self.rate if self.rate > 0 else 0
+        start = time.monotonic()
+        end = start + self.duration
+
+        seq = 0
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+            if interval:
+                delay = start + seq * interval - now
+                if delay > 0:
+                    time.sleep(delay)
+
+            data = self.message(self.addresses[seq % len(self.addresses)], seq)
+            self.sent.append(time.monotonic())
+            sock.sendto(data, self.address)
+            seq += 1
+
+        sock.close()
+
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OSC to ZOCP bridge")
+    parser.add_argument("--threads", type=int, default=4, help="number of sending threads")
+    parser.add_argument("--addresses", type=int, default=100, help="addresses per thread")
+    parser.add_argument("--typetags", default="f", help="typetags of each message, eg f, i, fff or s")
+    parser.add_argument("--rate", type=float, default=0, help="messages/s per thread, 0 for as fast as possible")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to send")
+    parser.add_argument("--workers", type=int, default=0, help="'Receive workers' setting")
+    parser.add_argument("--pipeline", action="store_true", help="enable 'Receive pipeline'")
+    args = parser.parse_args()
+
+    node = OscBridgeNode("zosc_bench")
+    node.receive_ip = "127.0.0.1"
+    node.receive_port = free_port()
+    node.send_port = free_port()
+    node.receive_workers = args.workers
+    node.receive_pipeline = args.pipeline
+
+    bridge = threading.Thread(target=node.run, daemon=True)
+    node.start()
+    bridge.start()
+    # give the receive socket or workers time to come up
+    time.sleep(1.0 if args.workers else 0.2)
+    modified = node.modified
+
+    generators = [LoadGenerator(i, ("127.0.0.1", node.receive_port), args.addresses,
+            args.typetags, args.rate, args.duration) for i in range(args.threads)]
+    start = time.monotonic()
+    for generator in generators:
+        generator.start()
+    for generator in generators:
+        generator.join()
+    sent_time = time.monotonic() - start
+
+    # let the bridge catch up with what is still queued
+    time.sleep(0.5)
+    node.stop()
+    bridge.join()
+
+    latencies = []
+    emitted = 0
+    for name, data, emitted_at in node.signals:
+        if not name.startswith("/bench/"):
+            continue
+        emitted += 1
+        seq = data[0] if isinstance(data, list) else data
+        sent = generators[int(name.split("/")[2])].sent
+        latencies.append(emitted_at - sent[int(seq)])
+    latencies.sort()
+
+    sent = sum(len(generator.sent) for generator in generators)
+    learned = sum(1 for name in node.capability if name.startswith("/bench/"))
+    print("sent:            %d messages in %.2f s (%.0f msgs/s)" % (sent, sent_time, sent / sent_time))
+    print("emitted:         %d signals (%.0f msgs/s)" % (emitted, emitted / sent_time))
+    print("dropped:         %d (%.2f%%)" % (sent - emitted, 100.0 * (sent - emitted) / max(1, sent)))
+    print("capabilities:    %d learned, %d capability updates" % (learned, node.modified - modified))
+    print("latency (ms):    p50 %.3f  p90 %.3f  p99 %.3f  max %.3f" % (
+            percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000,
+            percentile(latencies, 99) * 1000, latencies[-1] * 1000 if latencies else 0))
+
+
+if __name__ == '__main__':
+    main()
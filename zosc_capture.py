@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+# Capture files of received OSC, written by the bridge and replayed by
+# zosc_replay.py. Kept apart from zosc.py so replaying does not need ZOCP
+
+import socket
+import struct
+import time
+
+
+# capture files start with CAPTURE_MAGIC, followed by records of a
+# CAPTURE_RECORD header (receive time in ns, IPv4 source address and
+# port, datagram length) and the datagram itself
+CAPTURE_MAGIC = b"ZOSCCAP1"
+CAPTURE_RECORD = struct.Struct("<q4sHH")
+
+
+class CaptureWriter(object):
+    # Appends received datagrams to a capture file through a large write
+    # buffer; the file is only flushed by flush() and close()
+    buffer_size = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab', buffering=self.buffer_size)
+        if self.file.tell() == 0:
+            self.file.write(CAPTURE_MAGIC)
+
+
+    def write(self, received, source, data):
+        try:
+            host = socket.inet_aton(source[0])
+        except OSError:
+            host = bytes(4)
+        self.file.write(CAPTURE_RECORD.pack(int(received * 1e9), host, source[1], len(data)))
+        self.file.write(data)
+
+
+    def flush(self):
+        self.file.flush()
+
+
+    def close(self):
+        self.file.close()
+
+
+
+def read_capture(path):
+    # yields (received_ns, (host, port), data) for each captured datagram
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError("'%s' is not an OSC capture file" % path)
+        while True:
+            header = f.read(CAPTURE_RECORD.size)
+            if len(header) < CAPTURE_RECORD.size:
+                return
+            received, host, port, size = CAPTURE_RECORD.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                # cut off while capturing
+                return
+            yield received, (socket.inet_ntoa(host), port), data
+
+
+def replay_capture(path, address, speed=1.0):
+    # send the datagrams in a capture file to address, with the original
+    # timing divided by speed; speed 0 sends as fast as possible
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = None
+    count = 0
+    try:
+        for received, source, data in read_capture(path):
+            if speed > 0:
+                if start is None:
+                    start = (received, time.monotonic())
+                delay = start[1] + (received - start[0]) / 1e9 / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            sock.sendto(data, address)
+            count += 1
+    finally:
+        sock.close()
+    return count
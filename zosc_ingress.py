@@ -0,0 +1,348 @@
+#!/usr/bin/python3
+
+import marshal
+import multiprocessing
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+
+import zmq
+import OSC
+
+
+def flatten(decoded, timetag=0, out=None):
+    # turn a decoded OSC packet into a list of (address, typetags, values,
+    # timetag) tuples, unpacking bundles recursively
+    if out is None:
+        out = []
+
+    if decoded[0] == "#bundle":
+        for element in decoded[2:]:
+            flatten(element, max(timetag, decoded[1]), out)
+    elif len(decoded) > 1:
+        out.append((decoded[0], decoded[1][1:], decoded[2:], timetag))
+
+    return out
+
+
+def decode_record(data, source, received, capture=False):
+    # decode a datagram into a (host, port, received, size, dropped,
+    # messages, raw) record; messages is None if the packet could not be
+    # decoded, and messages without arguments are dropped here already.
+    # raw is the datagram itself if it is to be captured, otherwise None
+    raw = data if capture else None
+    try:
+        messages = flatten(OSC.decodeOSC(data))
+    except Exception:
+        return (source[0], source[1], received, len(data), 0, None, raw)
+
+    count = len(messages)
+    messages = [message for message in messages if message[2]]
+    return (source[0], source[1], received, len(data), count - len(messages), messages, raw)
+
+
+def set_reuse_port(sock, enabled):
+    # allow (or stop allowing) another socket to bind the address sock is
+    # bound to, as long as both have SO_REUSEPORT set. Returns False if
+    # the platform does not support it
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        return False
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1 if enabled else 0)
+    return True
+
+
+def run_worker(address, port, channel, rcvbuf_size, started, stopping, drain_limit, capturing):
+    # receive OSC on a socket shared with the other workers through
+    # SO_REUSEPORT, and push decoded records to the bridge over channel.
+    # The kernel picks the socket for each datagram by hashing its source
+    # address, so all packets from one sender go through the same worker
+    # and arrive at the bridge in order. None, or the error if the socket
+    # could not be bound, is put on the started queue. Once stopping is
+    # set, up to drain_limit datagrams still buffered in the socket are
+    # passed on before the worker exits. While capturing is set, records
+    # include the datagrams
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf_size)
+    try:
+        sock.bind((address, port))
+    except OSError as e:
+        started.put(str(e))
+        sock.close()
+        return
+    sock.settimeout(ShardedIngress.socket_timeout)
+    started.put(None)
+
+    context = zmq.Context()
+    push = context.socket(zmq.PUSH)
+    push.connect(channel)
+
+    try:
+        while not stopping.is_set():
+            try:
+                data, source = sock.recvfrom(8192)
+            except socket.timeout:
+                continue
+            record = decode_record(data, source, time.monotonic(), capturing.value)
+            push.send(marshal.dumps(record))
+
+        sock.setblocking(False)
+        for i in range(drain_limit):
+            try:
+                data, source = sock.recvfrom(8192)
+            except (BlockingIOError, InterruptedError):
+                break
+            record = decode_record(data, source, time.monotonic(), capturing.value)
+            push.send(marshal.dumps(record))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        # records that are still queued are delivered before exiting
+        push.close(linger=int(ShardedIngress.stop_timeout * 1000))
+        context.term()
+
+
+class ShardedIngress(object):
+    # Receives OSC on (address, port) in a number of worker processes and
+    # collects their decoded records (see decode_record) on a zmq PULL socket.
+    # The constructor returns once all workers are receiving, and raises
+    # OSError if they could not bind. Starting the worker interpreters
+    # takes a moment, up to startup_timeout, during which the caller blocks.
+    # The workers share the port through SO_REUSEPORT for as long as they
+    # run, so any socket of the same user with SO_REUSEPORT set can bind it
+    # as well; the current receiver has to be shared (see share()) first.
+    # With capture, records include the datagrams, see set_capture()
+    rcvbuf_size = 4096 * 64
+    socket_timeout = 0.1
+    startup_timeout = 10.0
+    stop_timeout = 2.0
+    drain_limit = 4096
+
+    def __init__(self, address, port, workers, capture=False):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise OSError("SO_REUSEPORT is not supported on this platform")
+
+        self.address = address
+        self.port = port
+
+        self.path = os.path.join(tempfile.gettempdir(), "zosc-ingress-%d-%d" % (os.getpid(), id(self)))
+        self.context = zmq.Context.instance()
+        self.socket = self.context.socket(zmq.PULL)
+        self.socket.bind("ipc://%s" % self.path)
+
+        # spawn instead of fork, so workers do not inherit the ZOCP node
+        spawn = multiprocessing.get_context('spawn')
+        started = spawn.Queue()
+        self.stopping = spawn.Event()
+        self.capturing = spawn.RawValue('b', capture)
+        self.stopped = []
+        self.processes = []
+        for i in range(workers):
+            process = spawn.Process(target=run_worker, daemon=True,
+                    args=(address, port, "ipc://%s" % self.path, self.rcvbuf_size, started,
+                        self.stopping, self.drain_limit, self.capturing))
+            process.start()
+            self.processes.append(process)
+
+        try:
+            for process in self.processes:
+                error = started.get(timeout=self.startup_timeout)
+                if error is not None:
+                    raise OSError(error)
+        except queue.Empty:
+            self.close()
+            raise OSError("receive workers did not start")
+        except OSError:
+            self.close()
+            raise
+
+
+    def receive_batch(self, limit):
+        # returns up to limit records that are waiting
+        out = self.stopped[:limit]
+        del self.stopped[:limit]
+        return out + self._receive(limit - len(out))
+
+
+    def _receive(self, limit):
+        out = []
+        for i in range(limit):
+            try:
+                out.append(marshal.loads(self.socket.recv(zmq.NOBLOCK)))
+            except zmq.Again:
+                break
+        return out
+
+
+    def share(self, enabled=True):
+        # the worker sockets always share the port
+        return enabled
+
+
+    def set_capture(self, enabled):
+        self.capturing.value = enabled
+
+
+    def queue_depth(self):
+        return 0
+
+
+    def queue_drops(self):
+        return 0
+
+
+    def stop(self):
+        # stop receiving. The workers first pass on what is still buffered
+        # in their sockets; the records arriving meanwhile are kept, and
+        # can still be received with receive_batch. Workers that do not
+        # finish within stop_timeout are terminated
+        self.stopping.set()
+        deadline = time.monotonic() + self.stop_timeout
+        while any(process.is_alive() for process in self.processes) and time.monotonic() < deadline:
+            if self.socket.poll(10):
+                self.stopped.extend(self._receive(self.drain_limit))
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.processes = []
+
+
+    def close(self):
+        self.stop()
+        self.socket.close(linger=0)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+
+class ThreadedIngress(object):
+    # Receives OSC on (address, port) in a pipeline of threads: a receive
+    # thread moves raw datagrams into a bounded queue, a decode thread turns
+    # them into records like ShardedIngress produces and puts them in a
+    # bounded ready queue. For every ready record a byte is written to a
+    # socketpair, so the bridge can poll self.socket and only ever picks
+    # up records that are already decoded. Packets that do not fit in a
+    # full queue are dropped and counted. With reuse_port, the socket is
+    # bound next to the shared receiver it replaces, see share(). With
+    # capture, records include the datagrams, see set_capture()
+    socket_timeout = 0.1
+    rcvbuf_size = 4096 * 64
+
+    def __init__(self, address, port, queue_size=4096, reuse_port=False, capture=False):
+        self.address = address
+        self.port = port
+        self.capture = capture
+
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf_size)
+        if reuse_port:
+            set_reuse_port(self.udp_socket, True)
+        try:
+            self.udp_socket.bind((address, port))
+        except OSError:
+            self.udp_socket.close()
+            raise
+        if reuse_port:
+            # no other socket can bind the port until shared again
+            set_reuse_port(self.udp_socket, False)
+        self.udp_socket.settimeout(self.socket_timeout)
+
+        self.raw = queue.Queue(queue_size)
+        self.ready = queue.Queue(queue_size)
+        self.raw_drops = 0
+        self.ready_drops = 0
+
+        self.socket, self._notify = socket.socketpair()
+        self.socket.setblocking(False)
+
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.receive_loop, daemon=True),
+            threading.Thread(target=self.decode_loop, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+
+    def receive_loop(self):
+        while self.running:
+            try:
+                data, source = self.udp_socket.recvfrom(8192)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self.running:
+                    print("Could not receive OSC data on %s:%s" % (self.address, self.port))
+                break
+
+            try:
+                self.raw.put_nowait((data, source, time.monotonic()))
+            except queue.Full:
+                self.raw_drops += 1
+
+        # wake up the decode thread so it can stop as well
+        self.raw.put(None)
+
+
+    def decode_loop(self):
+        while True:
+            item = self.raw.get()
+            if item is None:
+                break
+
+            try:
+                self.ready.put_nowait(decode_record(*item, self.capture))
+            except queue.Full:
+                self.ready_drops += 1
+                continue
+            self._notify.send(b'\0')
+
+
+    def receive_batch(self, limit):
+        # returns up to limit decoded records, one for each notification
+        try:
+            count = len(self.socket.recv(limit))
+        except (BlockingIOError, InterruptedError):
+            return []
+        return [self.ready.get_nowait() for i in range(count)]
+
+
+    def share(self, enabled=True):
+        # let a replacement receiver bind the same address while this one
+        # is still open; returns False if that is not supported
+        return set_reuse_port(self.udp_socket, enabled)
+
+
+    def set_capture(self, enabled):
+        self.capture = enabled
+
+
+    def queue_depth(self):
+        return self.raw.qsize() + self.ready.qsize()
+
+
+    def queue_drops(self):
+        return self.raw_drops + self.ready_drops
+
+
+    def stop(self):
+        # stop receiving and wait for the packets received so far to be
+        # decoded; those can still be received with receive_batch
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+    def close(self):
+        self.stop()
+        self.udp_socket.close()
+        self.socket.close()
+        self._notify.close()
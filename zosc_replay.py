@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+
+# Sends an OSC capture made by the bridge (see 'Capture file') to an
+# OSC server:
+#
+#   zosc_replay.py capture host:port [speed]
+#
+# speed is a factor on the original timing; 0 sends as fast as possible
+
+import sys
+import time
+
+from zosc_capture import replay_capture
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("usage: %s capture host:port [speed]" % sys.argv[0])
+        sys.exit(1)
+
+    host, port = sys.argv[2].rsplit(":", 1)
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+
+    start = time.monotonic()
+    count = replay_capture(sys.argv[1], (host, int(port)), speed)
+    print("Sent %d packets in %.2f s" % (count, time.monotonic() - start))